@@ -1,295 +1,471 @@
 # ehrQL codelists
+#
+# Codelists are registered below rather than loaded at import, and each one is
+# only read from disk the first time a definition accesses it as an attribute
+# of this module (see __getattr__ at the end of this file). Loaded codelists are
+# memoised as ordinary module globals.
 from ehrql import codelist_from_csv
 
+_csv_codelists = {}
+_composite_codelists = {}
+
+
+def csv_codelist(name, path, **kwargs):
+    _csv_codelists[name] = (path, kwargs)
+
+
+# composites are order-stable unions: codes shared between components appear once
+def composite_codelist(name, *components):
+    _composite_codelists[name] = components
+
+
 # Demographics
-ethnicity_codes = codelist_from_csv(
+csv_codelist(
+    "ethnicity_codes",
     "codelists/opensafely-ethnicity-snomed-0removed.csv",
     column="code",
     category_column="Grouping_6",
 )
 
 # Smoking
-clear_smoking_codes = codelist_from_csv(
+csv_codelist(
+    "clear_smoking_codes",
     "codelists/opensafely-smoking-clear.csv",
     column="CTV3Code",
     category_column="Category",
 )
 
 # Inflammatory rheumatology diagnoses
-axialspa_snomed = codelist_from_csv(
-    "codelists/user-markdrussell-axial-spondyloarthritis.csv", column="code",
+csv_codelist(
+    "axialspa_snomed",
+    "codelists/user-markdrussell-axial-spondyloarthritis.csv",
+    column="code",
 )
 
-axialspa_icd = codelist_from_csv(
-    "local_codelists/user-markdrussell-axial-spondyloarthritis-secondary-care_fixed.csv", column="code",
+csv_codelist(
+    "axialspa_icd",
+    "local_codelists/user-markdrussell-axial-spondyloarthritis-secondary-care_fixed.csv",
+    column="code",
 )
 
-psa_snomed = codelist_from_csv(
-    "codelists/user-markdrussell-psoriatic-arthritis.csv", column="code",
+csv_codelist(
+    "psa_snomed",
+    "codelists/user-markdrussell-psoriatic-arthritis.csv",
+    column="code",
 )
 
-psa_icd = codelist_from_csv(
-    "local_codelists/user-markdrussell-psoriatic-arthritis-secondary-care_fixed.csv", column="code",
+csv_codelist(
+    "psa_icd",
+    "local_codelists/user-markdrussell-psoriatic-arthritis-secondary-care_fixed.csv",
+    column="code",
 )
 
-rheumatoid_snomed = codelist_from_csv(
-    "codelists/user-markdrussell-new-rheumatoid-arthritis.csv", column="code",
+csv_codelist(
+    "rheumatoid_snomed",
+    "codelists/user-markdrussell-new-rheumatoid-arthritis.csv",
+    column="code",
 )
 
-rheumatoid_icd = codelist_from_csv(
-    "local_codelists/user-markdrussell-rheumatoid-arthritis-secondary-care_fixed.csv", column="code",
+csv_codelist(
+    "rheumatoid_icd",
+    "local_codelists/user-markdrussell-rheumatoid-arthritis-secondary-care_fixed.csv",
+    column="code",
 )
 
-undiffia_snomed = codelist_from_csv(
-    "codelists/user-markdrussell-undiff-eia.csv", column="code",
+csv_codelist(
+    "undiffia_snomed",
+    "codelists/user-markdrussell-undiff-eia.csv",
+    column="code",
 )
 
-gca_snomed = codelist_from_csv(
-    "codelists/user-markdrussell-giant-cell-arteritis.csv", column="code",
+csv_codelist(
+    "gca_snomed",
+    "codelists/user-markdrussell-giant-cell-arteritis.csv",
+    column="code",
 )
 
-gca_icd = codelist_from_csv(
-    "codelists/user-markdrussell-giant-cell-arteritis-secondary-care.csv", column="code",
+csv_codelist(
+    "gca_icd",
+    "codelists/user-markdrussell-giant-cell-arteritis-secondary-care.csv",
+    column="code",
 )
 
-sjogren_snomed = codelist_from_csv(
-    "codelists/user-markdrussell-sjogrens-syndrome.csv", column="code",
+csv_codelist(
+    "sjogren_snomed",
+    "codelists/user-markdrussell-sjogrens-syndrome.csv",
+    column="code",
 )
 
-sjogren_icd = codelist_from_csv(
-    "codelists/user-markdrussell-sjogrens-syndrome-secondary-care.csv", column="code",
+csv_codelist(
+    "sjogren_icd",
+    "codelists/user-markdrussell-sjogrens-syndrome-secondary-care.csv",
+    column="code",
 )
 
-ssc_snomed = codelist_from_csv(
-    "codelists/user-markdrussell-systemic-sclerosisscleroderma.csv", column="code",
+csv_codelist(
+    "ssc_snomed",
+    "codelists/user-markdrussell-systemic-sclerosisscleroderma.csv",
+    column="code",
 )
 
-ssc_icd = codelist_from_csv(
-    "codelists/user-markdrussell-systemic-sclerosis-secondary-care.csv", column="code",
+csv_codelist(
+    "ssc_icd",
+    "codelists/user-markdrussell-systemic-sclerosis-secondary-care.csv",
+    column="code",
 )
 
-sle_snomed = codelist_from_csv(
-    "codelists/user-markdrussell-systemic-lupus-erythematosus.csv", column="code",
+csv_codelist(
+    "sle_snomed",
+    "codelists/user-markdrussell-systemic-lupus-erythematosus.csv",
+    column="code",
 )
 
-sle_icd = codelist_from_csv(
-    "codelists/user-markdrussell-systemic-lupus-erythematosus-secondary-care.csv", column="code",
+csv_codelist(
+    "sle_icd",
+    "codelists/user-markdrussell-systemic-lupus-erythematosus-secondary-care.csv",
+    column="code",
 )
 
-myositis_snomed = codelist_from_csv(
-    "codelists/user-markdrussell-inflammatory-myositis.csv", column="code",
+csv_codelist(
+    "myositis_snomed",
+    "codelists/user-markdrussell-inflammatory-myositis.csv",
+    column="code",
 )
 
-myositis_icd = codelist_from_csv(
-    "local_codelists/user-markdrussell-inflammatory-myositis-secondary-care_fixed.csv", column="code",
+csv_codelist(
+    "myositis_icd",
+    "local_codelists/user-markdrussell-inflammatory-myositis-secondary-care_fixed.csv",
+    column="code",
 )
 
-anca_snomed = codelist_from_csv(
-    "codelists/user-markdrussell-anca-vasculitis.csv", column="code",
+csv_codelist(
+    "anca_snomed",
+    "codelists/user-markdrussell-anca-vasculitis.csv",
+    column="code",
 )
 
-anca_icd = codelist_from_csv(
-    "codelists/user-markdrussell-anca-vasculitis-secondary-care.csv", column="code",
+csv_codelist(
+    "anca_icd",
+    "codelists/user-markdrussell-anca-vasculitis-secondary-care.csv",
+    column="code",
 )
 
-eia_snomed = (
-    axialspa_snomed +
-    psa_snomed +
-    rheumatoid_snomed +
-    undiffia_snomed
+composite_codelist(
+    "eia_snomed",
+    "axialspa_snomed",
+    "psa_snomed",
+    "rheumatoid_snomed",
+    "undiffia_snomed",
+)
+
+composite_codelist(
+    "eia_icd",
+    "axialspa_icd",
+    "psa_icd",
+    "rheumatoid_icd",
+)
+
+composite_codelist(
+    "ctd_snomed",
+    "sjogren_snomed",
+    "ssc_snomed",
+    "sle_snomed",
+    "myositis_snomed",
+)
+
+composite_codelist(
+    "ctd_icd",
+    "sjogren_icd",
+    "ssc_icd",
+    "sle_icd",
+    "myositis_icd",
+)
+
+composite_codelist(
+    "vasc_snomed",
+    "anca_snomed",
+    "gca_snomed",
+)
+
+composite_codelist(
+    "vasc_icd",
+    "anca_icd",
+    "gca_icd",
+)
+
+composite_codelist(
+    "ctdvasc_snomed",
+    "sjogren_snomed",
+    "ssc_snomed",
+    "sle_snomed",
+    "myositis_snomed",
+    "anca_snomed",
+    "gca_snomed",
+)
+
+composite_codelist(
+    "ctdvasc_icd",
+    "sjogren_icd",
+    "ssc_icd",
+    "sle_icd",
+    "myositis_icd",
+    "anca_icd",
+    "gca_icd",
+)
+
+composite_codelist(
+    "all_snomed",
+    "axialspa_snomed",
+    "psa_snomed",
+    "rheumatoid_snomed",
+    "undiffia_snomed",
+    "sjogren_snomed",
+    "ssc_snomed",
+    "sle_snomed",
+    "myositis_snomed",
+    "anca_snomed",
+    "gca_snomed",
+)
+
+composite_codelist(
+    "all_icd",
+    "axialspa_icd",
+    "psa_icd",
+    "rheumatoid_icd",
+    "sjogren_icd",
+    "ssc_icd",
+    "sle_icd",
+    "myositis_icd",
+    "anca_icd",
+    "gca_icd",
 )
 
-eia_icd = (
-    axialspa_icd +
-    psa_icd +
-    rheumatoid_icd
+# Relevant comorbidities
+csv_codelist(
+    "chd_codes",
+    "codelists/nhsd-primary-care-domain-refsets-chd_cod.csv",
+    column="code",
 )
 
-ctd_snomed = (
-    sjogren_snomed +
-    ssc_snomed +
-    sle_snomed +
-    myositis_snomed
+csv_codelist(
+    "diabetes_codes",
+    "codelists/nhsd-primary-care-domain-refsets-dmtype2audit_cod.csv",
+    column="code",
 )
 
-ctd_icd = (
-    sjogren_icd +
-    ssc_icd +
-    sle_icd +
-    myositis_icd
+csv_codelist(
+    "ild_codes",
+    "codelists/nhsd-primary-care-domain-refsets-interstitial-lung-disease-codes.csv",
+    column="code",
 )
 
-vasc_snomed = (
-    anca_snomed +
-    gca_snomed
+csv_codelist(
+    "copd_codes",
+    "codelists/nhsd-primary-care-domain-refsets-copd_cod.csv",
+    column="code",
 )
 
-vasc_icd = (
-    anca_icd +
-    gca_icd
+csv_codelist(
+    "stroke_codes",
+    "codelists/nhsd-primary-care-domain-refsets-strk_cod.csv",
+    column="code",
 )
 
-ctdvasc_snomed = (
-    sjogren_snomed +
-    ssc_snomed +
-    sle_snomed +
-    myositis_snomed +
-    anca_snomed +
-    gca_snomed
+csv_codelist(
+    "tia_codes",
+    "codelists/nhsd-primary-care-domain-refsets-tia_cod.csv",
+    column="code",
 )
 
-ctdvasc_icd = (
-    sjogren_icd +
-    ssc_icd +
-    sle_icd +
-    myositis_icd +
-    anca_icd +
-    gca_icd
+composite_codelist(
+    "cva_codes",
+    "stroke_codes",
+    "tia_codes",
 )
 
-all_snomed = (
-    axialspa_snomed +
-    psa_snomed +
-    rheumatoid_snomed +
-    undiffia_snomed +
-    sjogren_snomed +
-    ssc_snomed +
-    sle_snomed +
-    myositis_snomed +
-    anca_snomed +
-    gca_snomed
+csv_codelist(
+    "lung_cancer_codes",
+    "codelists/nhsd-primary-care-domain-refsets-lung-cancer-codes.csv",
+    column="code",
 )
 
-all_icd = (
-    axialspa_icd +
-    psa_icd +
-    rheumatoid_icd +
-    sjogren_icd +
-    ssc_icd +
-    sle_icd +
-    myositis_icd +
-    anca_icd +
-    gca_icd
+csv_codelist(
+    "haem_cancer_codes",
+    "codelists/nhsd-primary-care-domain-refsets-c19haemcan_cod.csv",
+    column="code",
 )
 
-# Relevant comorbidities
-chd_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-chd_cod.csv", column="code",
+csv_codelist(
+    "solid_cancer_codes",
+    "codelists/nhsd-primary-care-domain-refsets-solid-cancer-diagnosis-codes.csv",
+    column="code",
 )
 
-diabetes_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-dmtype2audit_cod.csv", column="code",
+csv_codelist(
+    "ckd_codes",
+    "codelists/nhsd-primary-care-domain-refsets-ckdatrisk2_cod.csv",
+    column="code",
 )
 
-ild_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-interstitial-lung-disease-codes.csv",
+csv_codelist(
+    "creatinine_codes",
+    "codelists/ardens-creatinine-level.csv",
     column="code",
 )
 
-copd_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-copd_cod.csv", column="code",
+csv_codelist(
+    "depression_codes",
+    "codelists/nhsd-primary-care-domain-refsets-depr_cod.csv",
+    column="code",
 )
 
-stroke_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-strk_cod.csv", column="code",
+csv_codelist(
+    "osteoporosis_codes",
+    "codelists/nhsd-primary-care-domain-refsets-osteo_cod.csv",
+    column="code",
 )
 
-tia_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-tia_cod.csv", column="code",
+## Fragility fracture
+csv_codelist(
+    "fracture_codes",
+    "codelists/nhsd-primary-care-domain-refsets-ff_cod.csv",
+    column="code",
 )
 
-cva_codes = (
-    stroke_codes +
-    tia_codes
+csv_codelist(
+    "dementia_codes",
+    "codelists/nhsd-primary-care-domain-refsets-dem_cod.csv",
+    column="code",
 )
 
-lung_cancer_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-lung-cancer-codes.csv", column="code",
+bmi_codes = ["60621009", "846931000000101"]
+
+csv_codelist(
+    "referral_rheummsk",
+    "codelists/user-markdrussell-referral-rheumatology.csv",
+    column="code",
 )
 
-haem_cancer_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-c19haemcan_cod.csv", column="code",
+csv_codelist(
+    "referral_rheumatology",
+    "codelists/user-markdrussell-referral-to-rheumatology-only.csv",
+    column="code",
 )
 
-solid_cancer_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-solid-cancer-diagnosis-codes.csv", column="code",
+csv_codelist(
+    "rf_tests",
+    "codelists/user-markdrussell-rheumatoid-factor.csv",
+    column="code",
 )
 
-ckd_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-ckdatrisk2_cod.csv", column="code",
+csv_codelist(
+    "ccp_tests",
+    "codelists/user-markdrussell-cyclic-citrullinated-peptide-ccp-antibody.csv",
+    column="code",
 )
 
-creatinine_codes = codelist_from_csv(
-    "codelists/ardens-creatinine-level.csv", column="code",
+csv_codelist(
+    "rf_codes",
+    "codelists/user-markdrussell-rheumatoid-factor-positive-finding.csv",
+    column="code",
 )
 
-depression_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-depr_cod.csv", column="code",
+csv_codelist(
+    "ccp_codes",
+    "codelists/user-markdrussell-cyclic-citrullinated-peptide-ccp-antibody-positive-finding.csv",
+    column="code",
 )
 
-osteoporosis_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-osteo_cod.csv", column="code",
+csv_codelist(
+    "seropositive_codes",
+    "codelists/user-markdrussell-seropositive-rheumatoid-arthritis.csv",
+    column="code",
 )
 
-## Fragility fracture
-fracture_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-ff_cod.csv", column="code",
+csv_codelist(
+    "erosive_codes",
+    "codelists/user-markdrussell-erosive-rheumatoid-arthritis.csv",
+    column="code",
 )
 
-dementia_codes = codelist_from_csv(
-    "codelists/nhsd-primary-care-domain-refsets-dem_cod.csv", column="code",
+# MEDICATIONS
+csv_codelist(
+    "hydroxychloroquine_codes",
+    "codelists/opensafely-hydroxychloroquine.csv",
+    column="code",
+)
+csv_codelist(
+    "leflunomide_codes",
+    "codelists/opensafely-leflunomide-dmd.csv",
+    column="code",
+)
+csv_codelist(
+    "methotrexate_codes",
+    "codelists/opensafely-methotrexate-oral.csv",
+    column="code",
+)
+csv_codelist(
+    "methotrexate_inj_codes",
+    "codelists/opensafely-methotrexate-injectable.csv",
+    column="code",
+)
+csv_codelist(
+    "sulfasalazine_codes",
+    "codelists/opensafely-sulfasalazine-oral-dmd.csv",
+    column="code",
+)
+csv_codelist(
+    "steroid_codes",
+    "codelists/user-markdrussell-corticosteroids-oral-im-or-iv-dmd.csv",
+    column="code",
 )
 
-bmi_codes = ["60621009", "846931000000101"]
 
-referral_rheummsk = codelist_from_csv(
-    "codelists/user-markdrussell-referral-rheumatology.csv", column = "code"
-)
+# Codes appearing in more than one of the given codelists (by default the
+# disease codelists making up all_snomed and all_icd), mapped to those codelists
+def overlapping_codes(*names):
+    names = names or (
+        _composite_codelists["all_snomed"] + _composite_codelists["all_icd"]
+    )
+    codelists_by_code = {}
+    for name in names:
+        for code in _get(name):
+            codelists_by_code.setdefault(code, []).append(name)
+    return {
+        code: found_in
+        for code, found_in in codelists_by_code.items()
+        if len(found_in) > 1
+    }
 
-referral_rheumatology = codelist_from_csv(
-    "codelists/user-markdrussell-referral-to-rheumatology-only.csv", column = "code"
-)
 
-rf_tests = codelist_from_csv(
-    "codelists/user-markdrussell-rheumatoid-factor.csv", column = "code"
-)
+def _get(name):
+    return globals()[name] if name in globals() else __getattr__(name)
 
-ccp_tests = codelist_from_csv(
-    "codelists/user-markdrussell-cyclic-citrullinated-peptide-ccp-antibody.csv", column = "code"
-)
 
-rf_codes = codelist_from_csv(
-    "codelists/user-markdrussell-rheumatoid-factor-positive-finding.csv", column = "code"
-)
+def __getattr__(name):
+    if name in _csv_codelists:
+        path, kwargs = _csv_codelists[name]
+        codelist = codelist_from_csv(path, **kwargs)
+    elif name in _composite_codelists:
+        codelist = list(
+            dict.fromkeys(
+                code
+                for component in _composite_codelists[name]
+                for code in _get(component)
+            )
+        )
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-ccp_codes = codelist_from_csv(
-    "codelists/user-markdrussell-cyclic-citrullinated-peptide-ccp-antibody-positive-finding.csv", column = "code"
-)
+    globals()[name] = codelist
+    return codelist
 
-seropositive_codes = codelist_from_csv(
-    "codelists/user-markdrussell-seropositive-rheumatoid-arthritis.csv", column = "code"
-)
 
-erosive_codes = codelist_from_csv(
-    "codelists/user-markdrussell-erosive-rheumatoid-arthritis.csv", column = "code"
-)
+def __dir__():
+    return sorted(set(globals()) | set(_csv_codelists) | set(_composite_codelists))
 
-# MEDICATIONS
-hydroxychloroquine_codes = codelist_from_csv(
-    "codelists/opensafely-hydroxychloroquine.csv", column="code"
-)  
-leflunomide_codes = codelist_from_csv(  
-    "codelists/opensafely-leflunomide-dmd.csv", column="code"
-)    
-methotrexate_codes = codelist_from_csv(                   
-    "codelists/opensafely-methotrexate-oral.csv", column="code"
-)                   
-methotrexate_inj_codes = codelist_from_csv(                         
-    "codelists/opensafely-methotrexate-injectable.csv", column="code"
-)                   
-sulfasalazine_codes = codelist_from_csv(       
-    "codelists/opensafely-sulfasalazine-oral-dmd.csv", column="code"
-)
-steroid_codes = codelist_from_csv(       
-    "codelists/user-markdrussell-corticosteroids-oral-im-or-iv-dmd.csv", column="code"
-)
\ No newline at end of file
+
+if __name__ == "__main__":
+    print("code,codelists")
+    for code, found_in in overlapping_codes().items():
+        print(f"{code},{' '.join(found_in)}")
@@ -0,0 +1,27 @@
+from ehrql.tables.tpp import clinical_events
+
+# Comorbidity dates either side of a diagnosis date, for any number of categories
+# given as a {name: codelist} dict.
+
+
+# Clinical events coded with one category's codelist
+def comorbidity_events(codelist):
+    return clinical_events.where(
+        clinical_events.snomedct_code.is_in(codelist)
+    )
+
+
+# First date of each category on or before date ({name}_before_date) and after date, up to end date ({name}_after_date)
+def comorbidity_dates(codelists_by_name, dx_date, end_date):
+    columns = {}
+    for name, codelist in codelists_by_name.items():
+        before = comorbidity_events(codelist)
+        columns[f"{name}_before_date"] = before.where(
+            before.date <= dx_date
+        ).date.minimum_for_patient()
+    for name, codelist in codelists_by_name.items():
+        after = comorbidity_events(codelist)
+        columns[f"{name}_after_date"] = after.where(
+            (after.date > dx_date) & (after.date.is_on_or_before(end_date))
+        ).date.minimum_for_patient()
+    return columns
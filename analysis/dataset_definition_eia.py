@@ -2,9 +2,21 @@ from ehrql import create_dataset, days, months, years, case, when
 from ehrql.tables.tpp import patients, medications, practice_registrations, clinical_events, addresses, appointments, opa, wl_clockstops, wl_openpathways
 from datetime import date
 import codelists_ehrQL as codelists
-from analysis.dataset_definition_incidence import create_dataset_with_variables, get_population
+from registration_coverage import registration_for
+from comorbidities import comorbidity_dates
+from prescriptions import prescription_summary
+from outpatients import specialty_appointments, appointments_around, first_attendances, first_appointment, appointment_count_within, last_referral_before
+from incidence_variables import incidence_output_table, incidence_columns
 
-dataset = create_dataset_with_variables()
+dataset = create_dataset()
+dataset.configure_dummy_data(population_size=10000)
+
+# Disease columns are read from the incidence extraction output (generate_dataset_incidence) rather than recomputed - only the variables below are queried from the database
+eia_diseases = ["eia", "rheumatoid", "psa", "axialspa", "undiffia"]
+incidence = incidence_output_table(eia_diseases)
+
+for name in incidence_columns(eia_diseases):
+    dataset.add_column(name, getattr(incidence, name))
 
 # Dates for study
 index_date = "2016-04-01"
@@ -42,53 +54,25 @@ dataset.rf_test_date=any_test_in_period(codelists.rf_tests).date
 dataset.ccp_test_value=any_test_in_period(codelists.ccp_tests).numeric_value
 dataset.ccp_test_date=any_test_in_period(codelists.ccp_tests).date
 
-# Baseline comorbidities (first match before rheum diagnostic code; uses NHSE Ref Sets)
-def baseline_comorbidity_in_period(dx_codelist):
-    return clinical_events.where(
-        clinical_events.snomedct_code.is_in(dx_codelist)
-    ).where(
-        clinical_events.date <= getattr(dataset, "eia_inc_date")
-    ).sort_by(
-        clinical_events.date
-    ).first_for_patient()
-
-dataset.chd_before_date=baseline_comorbidity_in_period(codelists.chd_codes).date
-dataset.dm_before_date=baseline_comorbidity_in_period(codelists.diabetes_codes).date
-dataset.ild_before_date=baseline_comorbidity_in_period(codelists.ild_codes).date
-dataset.copd_before_date=baseline_comorbidity_in_period(codelists.copd_codes).date
-dataset.cva_before_date=baseline_comorbidity_in_period(codelists.cva_codes).date
-dataset.lung_ca_before_date=baseline_comorbidity_in_period(codelists.lung_cancer_codes).date
-dataset.solid_ca_before_date=baseline_comorbidity_in_period(codelists.solid_cancer_codes).date
-dataset.haem_ca_before_date=baseline_comorbidity_in_period(codelists.haem_cancer_codes).date
-dataset.ckd_before_date=baseline_comorbidity_in_period(codelists.ckd_codes).date
-dataset.depr_before_date=baseline_comorbidity_in_period(codelists.depression_codes).date
-dataset.osteop_before_date=baseline_comorbidity_in_period(codelists.osteoporosis_codes).date
-dataset.frac_before_date=baseline_comorbidity_in_period(codelists.fracture_codes).date
-dataset.dem_before_date=baseline_comorbidity_in_period(codelists.dementia_codes).date
-
-# New comorbidities (first match after rheum diagnostic code and before study end date; uses NHSE Ref Sets)
-def new_comorbidity_in_period(dx_codelist):
-    return clinical_events.where(
-        clinical_events.snomedct_code.is_in(dx_codelist)
-    ).where(
-        (clinical_events.date > getattr(dataset, "eia_inc_date")) & (clinical_events.date.is_on_or_before(fup_date))
-    ).sort_by(
-        clinical_events.date
-    ).first_for_patient()
-
-dataset.chd_after_date=new_comorbidity_in_period(codelists.chd_codes).date
-dataset.dm_after_date=new_comorbidity_in_period(codelists.diabetes_codes).date
-dataset.ild_after_date=new_comorbidity_in_period(codelists.ild_codes).date
-dataset.copd_after_date=new_comorbidity_in_period(codelists.copd_codes).date
-dataset.cva_after_date=new_comorbidity_in_period(codelists.cva_codes).date
-dataset.lung_ca_after_date=new_comorbidity_in_period(codelists.lung_cancer_codes).date
-dataset.solid_ca_after_date=new_comorbidity_in_period(codelists.solid_cancer_codes).date
-dataset.haem_ca_after_date=new_comorbidity_in_period(codelists.haem_cancer_codes).date
-dataset.ckd_after_date=new_comorbidity_in_period(codelists.ckd_codes).date
-dataset.depr_after_date=new_comorbidity_in_period(codelists.depression_codes).date
-dataset.osteop_after_date=new_comorbidity_in_period(codelists.osteoporosis_codes).date
-dataset.frac_after_date=new_comorbidity_in_period(codelists.fracture_codes).date
-dataset.dem_after_date=new_comorbidity_in_period(codelists.dementia_codes).date
+# Baseline comorbidities (first match before rheum diagnostic code) and new comorbidities (first match after rheum diagnostic code and before study end date); uses NHSE Ref Sets
+comorbidity_codelists = {
+    "chd": codelists.chd_codes,
+    "dm": codelists.diabetes_codes,
+    "ild": codelists.ild_codes,
+    "copd": codelists.copd_codes,
+    "cva": codelists.cva_codes,
+    "lung_ca": codelists.lung_cancer_codes,
+    "solid_ca": codelists.solid_cancer_codes,
+    "haem_ca": codelists.haem_cancer_codes,
+    "ckd": codelists.ckd_codes,
+    "depr": codelists.depression_codes,
+    "osteop": codelists.osteoporosis_codes,
+    "frac": codelists.fracture_codes,
+    "dem": codelists.dementia_codes,
+}
+
+for name, comorbidity_date in comorbidity_dates(comorbidity_codelists, getattr(dataset, "eia_inc_date"), fup_date).items():
+    dataset.add_column(name, comorbidity_date)
 
 # Relevant blood tests at baseline (last match before rheum diagnostic code)
 def last_test_in_period(dx_codelist):
@@ -142,157 +126,103 @@ dataset.smoking_status=case(
     otherwise="M"
 )
 
-# Rheumatology outpatient appointments
+# Rheumatology outpatient appointments (treatment function code 410, before end date)
+rheum_appointments = specialty_appointments("410", fup_date)
+rheum_appointments_around_dx = appointments_around(rheum_appointments, getattr(dataset, "eia_inc_date"), 12, 12)
+
 ## Date of first rheum appointment in the 1 year before or after rheum diagnostic code (with first attendance options selected)
-rheum_appt = opa.where(
-        (opa.appointment_date >= (getattr(dataset, "eia_inc_date") - years(1))) &
-        (opa.appointment_date <= (getattr(dataset, "eia_inc_date") + years(1))) &
-        (opa.appointment_date.is_on_or_before(fup_date)) &
-        (opa.treatment_function_code == "410") &
-        ((opa.first_attendance == "1") | (opa.first_attendance == "3"))
-    ).sort_by(
-        opa.appointment_date
-    ).first_for_patient()
+rheum_appt = first_appointment(first_attendances(rheum_appointments_around_dx))
 
 dataset.rheum_appt_date = rheum_appt.appointment_date
 dataset.rheum_appt_medium = rheum_appt.consultation_medium_used
 
 ## Date of first rheum appointment in the 1 year before or after rheum diagnostic code (without first attendance option selected)
-rheum_appt_any = opa.where(
-        (opa.appointment_date >= (getattr(dataset, "eia_inc_date") - years(1))) &
-        (opa.appointment_date <= (getattr(dataset, "eia_inc_date") + years(1))) &
-        (opa.appointment_date.is_on_or_before(fup_date)) &
-        (opa.treatment_function_code == "410")
-    ).sort_by(
-        opa.appointment_date
-    ).first_for_patient()
+rheum_appt_any = first_appointment(rheum_appointments_around_dx)
 
 dataset.rheum_appt_any_date = rheum_appt_any.appointment_date
 
 ## Rheum appointment count in the 1 year after first rheum appt (without first attendance option selected)
-dataset.rheum_appt_count = opa.where(
-        (opa.appointment_date >= dataset.rheum_appt_date) &
-        (opa.appointment_date <= (dataset.rheum_appt_date + years(1))) &
-        (opa.appointment_date.is_on_or_before(fup_date)) &
-        (opa.treatment_function_code == "410")
-    ).sort_by(
-        opa.appointment_date
-    ).count_for_patient()
+dataset.rheum_appt_count = appointment_count_within(rheum_appointments, dataset.rheum_appt_date, 12)
 
 # Rheumatology referrals
 ## Rheumatology referral date using HES OP data
 dataset.rheum_appt_ref_date = rheum_appt.referral_request_received_date
 dataset.rheum_any_ref_date = rheum_appt_any.referral_request_received_date
 
-## Last referral in the 12 months before rheumatology outpatient appt
-dataset.ref_12m_preappt_date = clinical_events.where(
-        clinical_events.snomedct_code.is_in(codelists.referral_rheumatology)
-    ).where(
-        (clinical_events.date >= (dataset.rheum_appt_date - years(1))) & (clinical_events.date <= dataset.rheum_appt_date)
-    ).sort_by(
-        clinical_events.date
-    ).last_for_patient().date
+## Last referral in the 12 and 6 months before rheumatology outpatient appt
+referrals_preappt = last_referral_before(codelists.referral_rheumatology, dataset.rheum_appt_date, [12, 6])
 
-## Last referral in the 6 months before rheumatology outpatient appt
-dataset.ref_6m_preappt_date = clinical_events.where(
-        clinical_events.snomedct_code.is_in(codelists.referral_rheumatology)
-    ).where(
-        (clinical_events.date >= (dataset.rheum_appt_date - months(6))) & (clinical_events.date <= dataset.rheum_appt_date)
-    ).sort_by(
-        clinical_events.date
-    ).last_for_patient().date
+dataset.ref_12m_preappt_date = referrals_preappt[12]
+dataset.ref_6m_preappt_date = referrals_preappt[6]
 
 # GP consultations removed
 
 # Most recent practice registration that lasted more than 12 months prior to rheum diagnosis
-def preceding_registration(dx_date):
-    return practice_registrations.where(
-        practice_registrations.start_date.is_on_or_before(dx_date - months(12))
-    ).except_where(
-        practice_registrations.end_date.is_on_or_before(dx_date)
-    ).sort_by(
-        practice_registrations.start_date,
-        practice_registrations.end_date,
-        practice_registrations.practice_pseudo_id,
-    ).last_for_patient()
+eia_registration = registration_for(getattr(dataset, "eia_inc_date"), 12)
 
-dataset.reg_end_date = preceding_registration(getattr(dataset, "eia_inc_date")).end_date
+dataset.reg_end_date = eia_registration.end_date
 
 # Practice region
-dataset.region = preceding_registration(getattr(dataset, "eia_inc_date")).practice_nuts1_region_name
+dataset.region = eia_registration.practice_nuts1_region_name
 
 # Medications
+## csDMARD and steroid (oral, IM, IV) prescriptions before end date
+drug_codelists = {
+    "leflunomide": codelists.leflunomide_codes,
+    "methotrexate_oral": codelists.methotrexate_codes,
+    "methotrexate_inj": codelists.methotrexate_inj_codes,
+    "sulfasalazine": codelists.sulfasalazine_codes,
+    "hydroxychloroquine": codelists.hydroxychloroquine_codes,
+    "steroid": codelists.steroid_codes,
+}
+
+prescription_windows = {
+    "all": (None, None),
+    "from_60d_before_dx": (getattr(dataset, "eia_inc_date") - days(60), None),
+    "from_60d_before_dx_to_12m": (getattr(dataset, "eia_inc_date") - days(60), getattr(dataset, "eia_inc_date") + years(1)),
+}
+
+prescriptions = prescription_summary(drug_codelists, prescription_windows, fup_date)
+
 ## Dates and counts of csDMARD prescriptions before end date (individuals with prescriptions of csDMARDs before first rheum code are excluded in data processing stages)
-def medication_dates_dmd (dx_codelist):
-    return medications.where(
-            medications.dmd_code.is_in(dx_codelist)
-    ).where(
-            medications.date.is_on_or_before(fup_date)
-    ).sort_by(
-            medications.date
-    )
+csdmards = {
+    "leflunomide": "lef",
+    "methotrexate_oral": "mtx_oral",
+    "methotrexate_inj": "mtx_inj",
+    "sulfasalazine": "ssz",
+    "hydroxychloroquine": "hcq",
+}
 
 ### First prescriptions
-dataset.leflunomide_date = medication_dates_dmd(codelists.leflunomide_codes).first_for_patient().date
-dataset.methotrexate_oral_date = medication_dates_dmd(codelists.methotrexate_codes).first_for_patient().date
-dataset.methotrexate_inj_date = medication_dates_dmd(codelists.methotrexate_inj_codes).first_for_patient().date
-dataset.sulfasalazine_date = medication_dates_dmd(codelists.sulfasalazine_codes).first_for_patient().date
-dataset.hydroxychloroquine_date = medication_dates_dmd(codelists.hydroxychloroquine_codes).first_for_patient().date
+for drug in csdmards:
+    dataset.add_column(f"{drug}_date", prescriptions[drug, "all"]["first_date"])
 
 ### Last prescriptions before end date
-dataset.lef_last_date = medication_dates_dmd(codelists.leflunomide_codes).last_for_patient().date
-dataset.mtx_oral_last_date = medication_dates_dmd(codelists.methotrexate_codes).last_for_patient().date
-dataset.mtx_inj_last_date = medication_dates_dmd(codelists.methotrexate_inj_codes).last_for_patient().date
-dataset.ssz_last_date = medication_dates_dmd(codelists.sulfasalazine_codes).last_for_patient().date
-dataset.hcq_last_date = medication_dates_dmd(codelists.hydroxychloroquine_codes).last_for_patient().date
+for drug, short_name in csdmards.items():
+    dataset.add_column(f"{short_name}_last_date", prescriptions[drug, "all"]["last_date"])
 
 ### Count of prescriptions before end date - need to amend this to within a 12-month period (after diagnosis vs. first script)
-dataset.leflunomide_count = medication_dates_dmd(codelists.leflunomide_codes).count_for_patient()
-dataset.methotrexate_oral_count = medication_dates_dmd(codelists.methotrexate_codes).count_for_patient()
-dataset.methotrexate_inj_count = medication_dates_dmd(codelists.methotrexate_inj_codes).count_for_patient()
-dataset.sulfasalazine_count = medication_dates_dmd(codelists.sulfasalazine_codes).count_for_patient()
-dataset.hydroxychloroquine_count = medication_dates_dmd(codelists.hydroxychloroquine_codes).count_for_patient()
+for drug in csdmards:
+    dataset.add_column(f"{drug}_count", prescriptions[drug, "all"]["count"])
 
 ## Dates and count of steroid prescriptions (oral, IM, IV) within 60 days before rheum code date and before end date
-def steroid_dates_dmd (dx_codelist):
-    return medications.where(
-            medications.dmd_code.is_in(dx_codelist)
-    ).where(
-            medications.date.is_on_or_before(fup_date)
-    ).except_where( 
-            medications.date < (getattr(dataset, "eia_inc_date") - days(60))
-    ).sort_by(
-            medications.date
-    )
-
-dataset.steroid_first_date = steroid_dates_dmd(codelists.steroid_codes).first_for_patient().date
-dataset.steroid_last_date = steroid_dates_dmd(codelists.steroid_codes).last_for_patient().date
-dataset.steroid_count = steroid_dates_dmd(codelists.steroid_codes).count_for_patient()
+dataset.steroid_first_date = prescriptions["steroid", "from_60d_before_dx"]["first_date"]
+dataset.steroid_last_date = prescriptions["steroid", "from_60d_before_dx"]["last_date"]
+dataset.steroid_count = prescriptions["steroid", "from_60d_before_dx"]["count"]
 
 ### Same as the above, but limited up to 12 months after diagnosis date
-def steroid_12m_dates_dmd (dx_codelist):
-    return medications.where(
-            medications.dmd_code.is_in(dx_codelist)
-    ).where(
-            medications.date.is_on_or_before(fup_date) &  
-            medications.date.is_on_or_before(getattr(dataset, "eia_inc_date") + years(1))  
-    ).except_where( 
-            medications.date < (getattr(dataset, "eia_inc_date") - days(60))
-    ).sort_by(
-            medications.date
-    )
-
-dataset.steroid_12m_first_date = steroid_12m_dates_dmd(codelists.steroid_codes).first_for_patient().date
-dataset.steroid_12m_last_date = steroid_12m_dates_dmd(codelists.steroid_codes).last_for_patient().date
-dataset.steroid_12m_count = steroid_12m_dates_dmd(codelists.steroid_codes).count_for_patient()
+dataset.steroid_12m_first_date = prescriptions["steroid", "from_60d_before_dx_to_12m"]["first_date"]
+dataset.steroid_12m_last_date = prescriptions["steroid", "from_60d_before_dx_to_12m"]["last_date"]
+dataset.steroid_12m_count = prescriptions["steroid", "from_60d_before_dx_to_12m"]["count"]
 
-incidence_dataset_population = get_population(dataset)
+## Treatment episodes for each csDMARD and steroids (prescriptions.prescription_episodes) are not extracted
+## until the generated SQL has been checked with ehrql dump-dataset-sql against the dummy tables
 
-# Define study population
+# Define study population (patients in the incidence population)
 dataset.define_population(
-    incidence_dataset_population &
+    incidence.exists_for_patient() &
     (getattr(dataset, "eia_inc_case")) &
     ((getattr(dataset, "eia_age") >= 18) & (getattr(dataset, "eia_age") <= 110)) &
-    (getattr(dataset, "eia_pre_reg")) &
+    (getattr(dataset, "eia_pre_reg_12m")) &
     (getattr(dataset, "eia_alive_inc"))
 )
\ No newline at end of file
@@ -2,7 +2,9 @@ from ehrql import create_dataset, days, months, years, case, when, create_measur
 from ehrql.tables.tpp import patients, medications, practice_registrations, clinical_events, apcs, addresses, ons_deaths, appointments
 from datetime import date, datetime
 import codelists_ehrQL as codelists
-from analysis.dataset_definition_incidence import dataset
+import demographics
+from registration_coverage import registered_for
+from incidence_variables import incidence_output_table, diseases, registration_lookbacks
 import sys
 
 # Arguments (from project.yaml)
@@ -11,28 +13,25 @@ from argparse import ArgumentParser
 parser = ArgumentParser()
 parser.add_argument("--start-date", type=str)
 parser.add_argument("--intervals", type=int)
+parser.add_argument("--registration-months", type=int, default=12, choices=registration_lookbacks)
 args = parser.parse_args()
 
 start_date = args.start_date
 intervals = args.intervals
 intervals_years = int(intervals/12)
+registration_months = args.registration_months
 
 index_date = INTERVAL.start_date
 end_date = INTERVAL.end_date
 
+# Incidence columns for the numerators, read from the incidence extraction (generate_dataset_incidence) rather than recomputed for every interval
+incidence = incidence_output_table(diseases)
+
 # Currently registered
 curr_registered = practice_registrations.for_patient_on(index_date).exists_for_patient()
 
-# Registration for at least 12 months before index date
-pre_registrations = (
-    practice_registrations.where(
-        practice_registrations.start_date.is_on_or_before(index_date - months(12))
-    ).except_where(
-        practice_registrations.end_date.is_on_or_before(index_date)
-    )
-)
-
-preceding_reg_index = pre_registrations.exists_for_patient()
+# Registration for at least 12 months before index date (24 months for sensitivity analysis)
+preceding_reg_index = registered_for(index_date, registration_months)
 
 # Age at interval start
 age = patients.age_on(index_date)
@@ -55,16 +54,16 @@ measures.define_defaults(intervals=months(intervals).starting_on(start_date))
 # Population denominator (currently registered)
 current_denominator = (
     ((age >= 18) & (age <= 110))
-    & dataset.sex.is_in(["male", "female"])
-    & (dataset.date_of_death.is_after(index_date) | dataset.date_of_death.is_null())
+    & demographics.sex.is_in(["male", "female"])
+    & (demographics.date_of_death.is_after(index_date) | demographics.date_of_death.is_null())
     & curr_registered
 )
 
-# Population denominator (with 12m+ preceding registration)
+# Population denominator (with 12m+, or 24m+ for sensitivity analysis, preceding registration)
 preceding_denominator = (
     ((age >= 18) & (age <= 110))
-    & dataset.sex.is_in(["male", "female"])
-    & (dataset.date_of_death.is_after(index_date) | dataset.date_of_death.is_null())
+    & demographics.sex.is_in(["male", "female"])
+    & (demographics.date_of_death.is_after(index_date) | demographics.date_of_death.is_null())
     & preceding_reg_index
 )
 
@@ -81,7 +80,7 @@ measures.define_measure(
     numerator=preceding_denominator,
     denominator=current_denominator,
     group_by={
-        "sex": dataset.sex,
+        "sex": demographics.sex,
         "age": age_band,  
     },
 )
@@ -92,7 +91,7 @@ measures.define_measure(
     numerator=preceding_denominator,
     denominator=current_denominator,
     group_by={
-        "ethnicity": dataset.ethnicity,
+        "ethnicity": demographics.ethnicity,
     },
 )
 
@@ -102,6 +101,42 @@ measures.define_measure(
     numerator=preceding_denominator,
     denominator=current_denominator,
     group_by={
-        "imd": dataset.imd_quintile,
+        "imd": demographics.imd_quintile,
     },
-)
\ No newline at end of file
+)
+
+# Incidence numerators - incident cases diagnosed within the interval, aged 18-110, registered for the preceding months and alive at diagnosis.
+# ehrQL only counts numerator patients who are also in the denominator, so cases must also meet the preceding_denominator criteria at the interval start -
+# e.g. a case aged 18 at diagnosis but 17 at the interval start, or first registered during the interval, is not counted, although incidence cleaning keeps them.
+subgroups = {
+    "bands": {"sex": demographics.sex, "age": age_band},
+    "ethn": {"ethnicity": demographics.ethnicity},
+    "imd": {"imd": demographics.imd_quintile},
+}
+
+for disease in diseases:
+    inc_date = getattr(incidence, f"{disease}_inc_date")
+    inc_age = getattr(incidence, f"{disease}_age")
+
+    incident_case = (
+        inc_date.is_on_or_between(index_date, end_date)
+        & ((inc_age >= 18) & (inc_age <= 110))
+        & getattr(incidence, f"{disease}_pre_reg_{registration_months}m")
+        & getattr(incidence, f"{disease}_alive_inc")
+    ).when_null_then(False)
+
+    # Incidence overall
+    measures.define_measure(
+        name=f"{disease}_incidence",
+        numerator=incident_case,
+        denominator=preceding_denominator,
+    )
+
+    # Incidence by age and sex, ethnicity and IMD quintile (age band at interval start, as for the denominator)
+    for subgroup, group_by in subgroups.items():
+        measures.define_measure(
+            name=f"{disease}_incidence_{subgroup}",
+            numerator=incident_case,
+            denominator=preceding_denominator,
+            group_by=group_by,
+        )
@@ -4,6 +4,7 @@ from ehrql.codes import ICD10Code
 from datetime import date, datetime
 from functools import reduce
 import codelists_ehrQL as codelists
+import demographics
 
 index_date = date(2016, 4, 1)
 end_date = date(2025, 3, 31)
@@ -39,10 +40,10 @@ dataset.first_registration_12m = (
 dataset.cohort_entry_date = maximum_of(index_date, dataset.first_registration_12m)
 
 # Define sex
-dataset.sex = patients.sex
+dataset.sex = demographics.sex
 
 # Date of death
-dataset.date_of_death = patients.date_of_death
+dataset.date_of_death = demographics.date_of_death
 
 dataset.alive_at_entry = (
     patients.date_of_death.is_null() | patients.date_of_death.is_after(dataset.cohort_entry_date)
@@ -62,35 +63,11 @@ dataset.age_band = case(
 )
 
 # Define patient ethnicity (latest code)
-latest_ethnicity_code = (
-    clinical_events.where(clinical_events.snomedct_code.is_in(codelists.ethnicity_codes))
-    .where(clinical_events.date.is_on_or_before(end_date))
-    .sort_by(clinical_events.date)
-    .last_for_patient().snomedct_code.to_category(codelists.ethnicity_codes)
-)
-
-# Extract ethnicity from SUS records if it isn't present in primary care data 
-ethnicity_sus = ethnicity_from_sus.code
-
-dataset.ethnicity = case(
-    when((latest_ethnicity_code == "1") | ((latest_ethnicity_code.is_null()) & (ethnicity_sus.is_in(["A", "B", "C"])))).then("White"),
-    when((latest_ethnicity_code == "2") | ((latest_ethnicity_code.is_null()) & (ethnicity_sus.is_in(["D", "E", "F", "G"])))).then("Mixed"),
-    when((latest_ethnicity_code == "3") | ((latest_ethnicity_code.is_null()) & (ethnicity_sus.is_in(["H", "J", "K", "L"])))).then("Asian or Asian British"),
-    when((latest_ethnicity_code == "4") | ((latest_ethnicity_code.is_null()) & (ethnicity_sus.is_in(["M", "N", "P"])))).then("Black or Black British"),
-    when((latest_ethnicity_code == "5") | ((latest_ethnicity_code.is_null()) & (ethnicity_sus.is_in(["R", "S"])))).then("Chinese or Other Ethnic Groups"),
-    otherwise="Unknown", 
-) 
+dataset.ethnicity = demographics.ethnicity
 
 # Define patient IMD at cohort entry
-imd = addresses.for_patient_on(dataset.cohort_entry_date).imd_rounded
-
-dataset.imd_quintile = case(
-    when((imd >= 0) & (imd < int(32844 * 1 / 5))).then("1 (most deprived)"),
-    when(imd < int(32844 * 2 / 5)).then("2"),
-    when(imd < int(32844 * 3 / 5)).then("3"),
-    when(imd < int(32844 * 4 / 5)).then("4"),
-    when(imd < int(32844 * 5 / 5)).then("5 (least deprived)"),
-    otherwise="Unknown",
+dataset.imd_quintile = demographics.imd_quintile_from(
+    addresses.for_patient_on(dataset.cohort_entry_date).imd_rounded
 )
 
 # Define population
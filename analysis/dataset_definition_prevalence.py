@@ -4,6 +4,7 @@ from ehrql.codes import ICD10Code
 from datetime import date, datetime
 from functools import reduce
 import codelists_ehrQL as codelists
+import demographics
 
 diseases = ["rheumatoid", "psa", "axialspa", "undiffia", "gca", "sjogren", "ssc", "sle", "myositis", "anca"]
 codelist_types = ["snomed", "icd"]
@@ -44,13 +45,15 @@ def first_code_in_period_icd(dx_codelist):
     
 # Expand 3-character ICD10 codes
 def expand_three_char_icd10_codes(dx_codelist):
-    return dx_codelist + [f"{code}X" for code in dx_codelist if len(code) == 3]
+    return list(dict.fromkeys(
+        dx_codelist + [f"{code}X" for code in dx_codelist if len(code) == 3]
+    ))
 
 # Define sex
-dataset.sex = patients.sex
+dataset.sex = demographics.sex
 
 # Date of death
-dataset.date_of_death = patients.date_of_death
+dataset.date_of_death = demographics.date_of_death
 
 # Define population as any registered patient after index date, then apply further restrictions in later processing steps
 dataset.define_population(
@@ -2,7 +2,8 @@ from ehrql import create_dataset, days, months, years, case, when, create_measur
 from ehrql.tables.tpp import patients, medications, practice_registrations, clinical_events, apcs, addresses, ons_deaths, appointments
 from datetime import date, datetime
 import codelists_ehrQL as codelists
-from analysis.dataset_definition_prevalence import dataset
+import demographics
+from analysis.dataset_definition_prevalence import dataset, diseases
 import sys
 
 # Arguments (from project.yaml)
@@ -11,12 +12,12 @@ from argparse import ArgumentParser
 parser = ArgumentParser()
 parser.add_argument("--start-date", type=str)
 parser.add_argument("--intervals", type=int)
-parser.add_argument("--disease", type=str)
+parser.add_argument("--disease", type=str, help="single disease to measure (default: all diseases)")
 args = parser.parse_args()
 
 start_date = args.start_date
 intervals_years = args.intervals
-disease = args.disease
+measure_diseases = [args.disease] if args.disease else diseases
 
 index_date = INTERVAL.start_date
 
@@ -44,8 +45,8 @@ measures.define_defaults(intervals=years(intervals_years).starting_on(start_date
 # Population denominator (currently registered)
 prev_denominator = (
     ((age >= 18) & (age <= 110))
-    & dataset.sex.is_in(["male", "female"])
-    & (dataset.date_of_death.is_after(index_date) | dataset.date_of_death.is_null())
+    & demographics.sex.is_in(["male", "female"])
+    & (demographics.date_of_death.is_after(index_date) | demographics.date_of_death.is_null())
     & curr_registered
 )
 
@@ -53,24 +54,27 @@ prev_denominator = (
 prev = {}
 prev_numerators = {} 
 
-# Prevalent diagnosis (at interval start)
-prev[disease + "_prev"] = (
-    (getattr(dataset, disease + "_inc_date") < index_date)
-).when_null_then(False)
+# Every disease shares the same denominator, age band and registration status
+for disease in measure_diseases:
 
-# Prevalence numerator - people registered on index date who have an diagnostic code on or before index date
-prev_numerators[disease + "_prev_num"] = (
-    prev[disease + "_prev"] & prev_denominator
-)
+    # Prevalent diagnosis (at interval start)
+    prev[disease + "_prev"] = (
+        (getattr(dataset, disease + "_inc_date") < index_date)
+    ).when_null_then(False)
+
+    # Prevalence numerator - people registered on index date who have an diagnostic code on or before index date
+    prev_numerators[disease + "_prev_num"] = (
+        prev[disease + "_prev"] & prev_denominator
+    )
 
-# Prevalence by age and sex
-measures.define_measure(
-    name=disease + "_prevalence",
-    numerator=prev_numerators[disease + "_prev_num"],
-    denominator=prev_denominator,
-    intervals=years(intervals_years).starting_on(start_date),
-    group_by={
-        "sex": dataset.sex,
-        "age": age_band,  
-    },
-)
\ No newline at end of file
+    # Prevalence by age and sex
+    measures.define_measure(
+        name=disease + "_prevalence",
+        numerator=prev_numerators[disease + "_prev_num"],
+        denominator=prev_denominator,
+        intervals=years(intervals_years).starting_on(start_date),
+        group_by={
+            "sex": demographics.sex,
+            "age": age_band,  
+        },
+    )
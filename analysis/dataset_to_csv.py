@@ -0,0 +1,199 @@
+import fnmatch
+import os
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import pyarrow
+import pyarrow.compute
+import pyarrow.csv
+import pyarrow.ipc
+
+# Reader/converter for the Arrow dataset outputs (ehrQL generate-dataset with an
+# .arrow output: native date and boolean columns, dictionary-encoded categories).
+# Converted CSVs are written the way ehrQL writes them (T/F booleans, ISO dates,
+# empty nulls) so Stata/R consumers don't need changing.
+#
+# --long splits a wide incidence extract into one row per patient per disease with
+# a non-null {disease}_inc_date, plus a per-patient demographics table, so output
+# size scales with the number of cases rather than patients x diseases.
+
+DEMOGRAPHIC_COLUMNS = ["sex", "date_of_death", "ethnicity", "imd_quintile"]
+
+# composite disease groups (incidence_variables.composite_groups) - their cases are
+# already rows of the individual diseases, so --long leaves them out by default
+COMPOSITE_GROUPS = ["eia", "ctd", "vasc", "ctdvasc", "all"]
+
+
+def read_dataset(path: Path, columns: list = None) -> pyarrow.Table:
+    with pyarrow.memory_map(str(path)) as source:
+        table = pyarrow.ipc.open_file(source).read_all()
+    if columns:
+        table = table.select(selected_columns(table.column_names, columns))
+    return table
+
+
+# patient_id, then every column matching any of the patterns, in file order
+def selected_columns(names: list, patterns: list) -> list:
+    return ["patient_id"] + [
+        name
+        for name in names
+        if name != "patient_id"
+        and any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+    ]
+
+
+# booleans as T/F and categories as plain strings, as ehrQL writes them
+def csv_column(column: pyarrow.ChunkedArray) -> pyarrow.ChunkedArray:
+    if pyarrow.types.is_boolean(column.type):
+        return pyarrow.compute.if_else(column, "T", "F")
+    if pyarrow.types.is_dictionary(column.type):
+        return column.cast(column.type.value_type)
+    return column
+
+
+def write_csv(table: pyarrow.Table, path: Path):
+    table = pyarrow.table(
+        [csv_column(column) for column in table.columns], names=table.column_names
+    )
+    try:
+        # unquoted, like ehrQL's own CSVs
+        pyarrow.csv.write_csv(
+            table, str(path), pyarrow.csv.WriteOptions(quoting_style="none")
+        )
+    except pyarrow.ArrowInvalid:
+        # a value contains a comma, quote or newline - quote every string instead
+        pyarrow.csv.write_csv(table, str(path))
+
+
+# individual diseases with an {disease}_inc_date column, in file order
+def dataset_diseases(table: pyarrow.Table) -> list:
+    return [
+        name.removesuffix("_inc_date")
+        for name in table.column_names
+        if name.endswith("_inc_date")
+        and name.removesuffix("_inc_date") not in COMPOSITE_GROUPS
+    ]
+
+
+# one row per patient per disease with an incident date - columns are the
+# disease's own columns without the disease prefix (null where a disease lacks one)
+def long_format(table: pyarrow.Table, diseases: list) -> pyarrow.Table:
+    fields = {}
+    for disease in diseases:
+        for field in table.schema:
+            if field.name.startswith(f"{disease}_"):
+                fields.setdefault(field.name.removeprefix(f"{disease}_"), field.type)
+
+    parts = []
+    for disease in diseases:
+        rows = table.filter(pyarrow.compute.is_valid(table[f"{disease}_inc_date"]))
+        columns = {
+            "patient_id": rows["patient_id"],
+            "disease": pyarrow.array([disease] * rows.num_rows).dictionary_encode(),
+        }
+        for name, field_type in fields.items():
+            column = f"{disease}_{name}"
+            columns[name] = (
+                rows[column]
+                if column in rows.column_names
+                else pyarrow.nulls(rows.num_rows, field_type)
+            )
+        parts.append(pyarrow.table(columns))
+    return pyarrow.concat_tables(parts).unify_dictionaries().combine_chunks()
+
+
+def demographics_table(table: pyarrow.Table) -> pyarrow.Table:
+    return table.select(
+        ["patient_id"] + [name for name in DEMOGRAPHIC_COLUMNS if name in table.column_names]
+    )
+
+
+def write_arrow(table: pyarrow.Table, path: Path):
+    with pyarrow.ipc.new_file(str(path), table.schema) as writer:
+        writer.write_table(table)
+
+
+# .arrow or .csv, by suffix
+def write_dataset(table: pyarrow.Table, path: Path):
+    if path.suffix == ".arrow":
+        write_arrow(table, path)
+    else:
+        write_csv(table, path)
+
+
+def benchmark_dataset(arrow_path: Path, csv_path: Path):
+    def measure(label: str, path: Path, load):
+        start = time.perf_counter()
+        table = load(path)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{label}: {os.path.getsize(path) / 2**20:.1f} MiB, "
+            f"{table.num_rows} rows x {table.num_columns} columns, "
+            f"loaded in {elapsed * 1000:.1f} ms"
+        )
+
+    measure("csv", csv_path, lambda path: pyarrow.csv.read_csv(str(path)))
+    measure("arrow", arrow_path, read_dataset)
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("dataset", type=Path, help="arrow dataset output to read")
+    parser.add_argument(
+        "--output",
+        type=Path,
+        help="csv to write (default: the dataset path with a .csv suffix)",
+    )
+    parser.add_argument(
+        "--columns",
+        nargs="+",
+        help="column names or globs to keep (patient_id is always kept)",
+    )
+    parser.add_argument(
+        "--long",
+        action="store_true",
+        help=(
+            "write one row per patient per disease with an incident date to --output, "
+            "and the demographics to --demographics-output"
+        ),
+    )
+    parser.add_argument(
+        "--diseases",
+        nargs="+",
+        help="diseases to include in --long output (default: every {disease}_inc_date except composite groups)",
+    )
+    parser.add_argument(
+        "--demographics-output",
+        type=Path,
+        help="demographics table for --long (default: <output>_demographics)",
+    )
+    parser.add_argument(
+        "--benchmark",
+        type=Path,
+        metavar="CSV",
+        help="compare size and load time against an existing csv of the same dataset, and exit",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_dataset(args.dataset, args.benchmark)
+        return
+
+    output = args.output or args.dataset.with_suffix(".csv")
+
+    if args.long:
+        table = read_dataset(args.dataset)
+        write_dataset(long_format(table, args.diseases or dataset_diseases(table)), output)
+        write_dataset(
+            demographics_table(table),
+            args.demographics_output
+            or output.with_name(f"{output.stem}_demographics{output.suffix}"),
+        )
+        return
+
+    write_csv(read_dataset(args.dataset, args.columns), output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from ehrql import case, when
+from ehrql.tables.tpp import patients, clinical_events, addresses, ethnicity_from_sus
+import codelists_ehrQL as codelists
+
+# Patient demographics shared by the dataset and measures definitions. These are
+# standalone series, so a definition can use them without building any disease
+# columns.
+
+end_date = "2025-03-31"
+
+# Sex
+sex = patients.sex
+
+# Date of death
+date_of_death = patients.date_of_death
+
+# Patient ethnicity (latest primary care code before study end date)
+latest_ethnicity_code = (
+    clinical_events.where(clinical_events.snomedct_code.is_in(codelists.ethnicity_codes))
+    .where(clinical_events.date.is_on_or_before(end_date))
+    .sort_by(clinical_events.date)
+    .last_for_patient().snomedct_code.to_category(codelists.ethnicity_codes)
+)
+
+# Extract ethnicity from SUS records if it isn't present in primary care data
+ethnicity_sus = ethnicity_from_sus.code
+
+ethnicity = case(
+    when((latest_ethnicity_code == "1") | ((latest_ethnicity_code.is_null()) & (ethnicity_sus.is_in(["A", "B", "C"])))).then("White"),
+    when((latest_ethnicity_code == "2") | ((latest_ethnicity_code.is_null()) & (ethnicity_sus.is_in(["D", "E", "F", "G"])))).then("Mixed"),
+    when((latest_ethnicity_code == "3") | ((latest_ethnicity_code.is_null()) & (ethnicity_sus.is_in(["H", "J", "K", "L"])))).then("Asian or Asian British"),
+    when((latest_ethnicity_code == "4") | ((latest_ethnicity_code.is_null()) & (ethnicity_sus.is_in(["M", "N", "P"])))).then("Black or Black British"),
+    when((latest_ethnicity_code == "5") | ((latest_ethnicity_code.is_null()) & (ethnicity_sus.is_in(["R", "S"])))).then("Chinese or Other Ethnic Groups"),
+    otherwise="Unknown",
+)
+
+
+# IMD quintile from a rounded IMD rank
+def imd_quintile_from(imd_rounded):
+    return case(
+        when((imd_rounded >= 0) & (imd_rounded < int(32844 * 1 / 5))).then("1 (most deprived)"),
+        when(imd_rounded < int(32844 * 2 / 5)).then("2"),
+        when(imd_rounded < int(32844 * 3 / 5)).then("3"),
+        when(imd_rounded < int(32844 * 4 / 5)).then("4"),
+        when(imd_rounded < int(32844 * 5 / 5)).then("5 (least deprived)"),
+        otherwise="Unknown",
+    )
+
+
+# Patient IMD (latest address)
+latest_address_per_patient = addresses.sort_by(addresses.start_date).last_for_patient()
+imd_quintile = imd_quintile_from(latest_address_per_patient.imd_rounded)
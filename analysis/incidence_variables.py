@@ -0,0 +1,250 @@
+from ehrql import create_dataset, days, months, years, case, when, minimum_of, maximum_of
+from ehrql.tables.tpp import patients, medications, practice_registrations, clinical_events, apcs, addresses, ethnicity_from_sus 
+from ehrql.codes import ICD10Code
+from ehrql.tables import PatientFrame, Series, table_from_file
+from datetime import date, datetime
+from functools import reduce
+import codelists_ehrQL as codelists
+import demographics
+from registration_coverage import registered_for_each
+
+# Incidence variables shared by the incidence dataset, incidence measures and EIA
+# definitions. Nothing is built on import - each definition builds the columns it needs.
+
+diseases = ["rheumatoid", "psa", "axialspa", "undiffia", "gca", "sjogren", "ssc", "sle", "myositis", "anca"]
+codelist_types = ["snomed", "icd"]
+
+# Composite disease groups from codelists_ehrQL (unions of the diseases above) - the builder accepts these alongside individual diseases
+composite_groups = ["eia", "ctd", "vasc", "ctdvasc", "all"]
+disease_groups = diseases + composite_groups
+
+# Disease groups written to the incidence extraction - the individual diseases, plus composites read by downstream definitions (eia for the EIA extraction)
+extracted_diseases = diseases + ["eia"]
+
+# Months of registration required before diagnosis - 12 for the main analysis, 24 for the sensitivity analysis
+registration_lookbacks = [12, 24]
+
+# Code dates per disease and source (1st to Nth, on distinct dates), and months within which a later code confirms the incident diagnosis - for "2+ codes" sensitivity definitions
+nth_code = 2
+confirmation_months = [12]
+
+index_date = "2016-04-01"
+end_date = "2025-03-31"
+fup_date = "2025-09-30"
+
+# Any practice registration before study end date
+any_registration = practice_registrations.where(
+            practice_registrations.start_date <= end_date
+        ).except_where(
+            practice_registrations.end_date < index_date    
+        ).exists_for_patient()
+
+# Builds columns for the given diseases and/or composite groups only, so each definition queries just the codelists it needs
+def create_dataset_with_variables(diseases=diseases, lookbacks=registration_lookbacks, nth_code=nth_code, confirmations=confirmation_months):
+    unknown = [disease for disease in diseases if disease not in disease_groups]
+    if unknown:
+        raise ValueError(f"Unknown disease or composite group: {', '.join(unknown)}")
+
+    dataset = create_dataset()
+    dataset.configure_dummy_data(population_size=10000)
+
+    # Diagnostic codes in primary care record (SNOMED) for one disease, up to follow-up date
+    def disease_events_snomed(disease):
+        return clinical_events.where(
+            clinical_events.snomedct_code.is_in(getattr(codelists, f"{disease}_snomed"))
+        ).where(
+            clinical_events.date.is_on_or_before(fup_date)
+        )
+
+    # Incident diagnostic code in primary care record (SNOMED) (assuming before study end date)
+    def first_code_in_period_snomed(disease):
+        events = disease_events_snomed(disease)
+        return events.where(
+            events.date.is_on_or_before(end_date)
+        ).sort_by(
+            events.date
+        ).first_for_patient()
+
+    # Dates of the 2nd to Nth codes, each on a later date than the one before (up to follow-up date) - e.g. to confirm a diagnosis by a second code
+    def later_code_dates(events, date_column, first_date, n):
+        dates = []
+        previous_date = first_date
+        for _ in range(2, n + 1):
+            later_events = events.where(getattr(events, date_column) > previous_date)
+            previous_date = getattr(later_events, date_column).minimum_for_patient()
+            dates.append(previous_date)
+        return dates
+
+    # Count of diagnostic codes in primary care record - could be used for sensitivity of those with 2+ codes
+    def count_code_in_period_snomed(disease):
+        events = disease_events_snomed(disease)
+        return events.except_where(
+            events.date.is_before(index_date)
+        ).count_for_patient()
+
+    # Expand 3-character ICD10 codes
+    def expand_three_char_icd10_codes(dx_codelist):
+        return list(dict.fromkeys(
+            dx_codelist + [f"{code}X" for code in dx_codelist if len(code) == 3]
+        ))
+
+    # Diagnostic codes in secondary care record (ICD10 primary diagnoses) for one disease, up to follow-up date
+    def disease_admissions_icd(disease):
+        return apcs.where(
+            apcs.primary_diagnosis.is_in(expand_three_char_icd10_codes(getattr(codelists, f"{disease}_icd")))
+        ).where(
+            apcs.admission_date.is_on_or_before(fup_date)
+        )
+
+    # Incident diagnostic code in secondary care record (ICD10 primary diagnoses) (assuming before study end date)
+    def first_code_in_period_icd(disease):
+        admissions = disease_admissions_icd(disease)
+        return admissions.where(
+            admissions.admission_date.is_on_or_before(end_date)
+        ).sort_by(
+            admissions.admission_date
+        ).first_for_patient()
+
+    # Count of diagnostic codes in secondary care record - could be used for sensitivity of those with 2+ codes
+    def count_code_in_period_icd(disease):
+        admissions = disease_admissions_icd(disease)
+        return admissions.except_where(
+            admissions.admission_date.is_before(index_date)
+        ).count_for_patient()
+
+    # Demographics (sex, date of death, ethnicity, IMD quintile)
+    dataset.sex = demographics.sex
+    dataset.date_of_death = demographics.date_of_death
+    dataset.ethnicity = demographics.ethnicity
+    dataset.imd_quintile = demographics.imd_quintile
+
+    for disease in diseases:
+
+        for codelist_type in codelist_types:
+
+            if (f"{codelist_type}" == "snomed"):
+                dataset.add_column(f"{disease}_prim_date", first_code_in_period_snomed(disease).date)
+                for n, code_date in enumerate(later_code_dates(disease_events_snomed(disease), "date", getattr(dataset, f"{disease}_prim_date"), nth_code), start=2):
+                    dataset.add_column(f"{disease}_prim_code{n}_date", code_date)
+                dataset.add_column(f"{disease}_prim_count", count_code_in_period_snomed(disease))
+            elif (f"{codelist_type}" == "icd"):
+                # Diseases without an ICD10 codelist (e.g. undiffia) get no secondary care columns
+                if hasattr(codelists, f"{disease}_icd"):
+                    dataset.add_column(f"{disease}_sec_date", first_code_in_period_icd(disease).admission_date)
+                    for n, code_date in enumerate(later_code_dates(disease_admissions_icd(disease), "admission_date", getattr(dataset, f"{disease}_sec_date"), nth_code), start=2):
+                        dataset.add_column(f"{disease}_sec_code{n}_date", code_date)
+                    dataset.add_column(f"{disease}_sec_count", count_code_in_period_icd(disease))
+            else:
+                dataset.add_column(f"{disease}_{codelist_type}_inc_date", None)
+
+        # Incident date for each disease - combined primary and secondary care 
+        dx_dates = [date for date in [
+            (getattr(dataset, f"{disease}_prim_date", None)),
+            (getattr(dataset, f"{disease}_sec_date", None))
+            ] if date is not None]
+        dataset.add_column(f"{disease}_inc_date",
+            minimum_of(*dx_dates) if len(dx_dates) > 1 else dx_dates[0],
+        )
+
+        # Confirmed by a later code (on a different date, in either source) within N months of incident diagnosis date - combined primary and secondary care
+        later_dates = [date for source in ["prim", "sec"] for date in [
+            getattr(dataset, f"{disease}_{source}_date", None),
+            getattr(dataset, f"{disease}_{source}_code2_date", None),
+            ] if date is not None]
+        for months_after in confirmations:
+            dataset.add_column(f"{disease}_confirmed_{months_after}m", reduce(lambda x, y: x | y, [
+                (later_date > getattr(dataset, f"{disease}_inc_date")) & (later_date <= getattr(dataset, f"{disease}_inc_date") + months(months_after))
+                for later_date in later_dates
+            ]).when_null_then(False))
+
+        # Incident date within window - combined primary and secondary care 
+        dataset.add_column(f"{disease}_inc_case",
+            (getattr(dataset, disease + "_inc_date").is_on_or_between(index_date, end_date)
+            ).when_null_then(False)
+        )
+
+        # Registration for each lookback preceding incident diagnosis date - combined primary and secondary care
+        for lookback, pre_reg in registered_for_each(getattr(dataset, f"{disease}_inc_date"), lookbacks).items():
+            dataset.add_column(f"{disease}_pre_reg_{lookback}m", pre_reg)
+
+        # Age at diagnosis - combined primary and secondary care
+        dataset.add_column(f"{disease}_age",
+            (patients.age_on(getattr(dataset, f"{disease}_inc_date"))
+            )               
+        )
+
+        # Alive at incident diagnosis date - combined primary and secondary care
+        dataset.add_column(f"{disease}_alive_inc",
+            ((dataset.date_of_death.is_after(getattr(dataset, f"{disease}_inc_date"))) | dataset.date_of_death.is_null()
+            ).when_null_then(False)
+        )
+
+        # Incident date within window - primary care only
+        dataset.add_column(f"{disease}_inc_case_p",
+            (getattr(dataset, disease + "_prim_date").is_on_or_between(index_date, end_date)
+            ).when_null_then(False)
+        )
+
+        # Registration for each lookback preceding incident diagnosis date - primary care only
+        for lookback, pre_reg in registered_for_each(getattr(dataset, f"{disease}_prim_date"), lookbacks).items():
+            dataset.add_column(f"{disease}_pre_reg_p_{lookback}m", pre_reg)
+
+        # Age at diagnosis - primary care only
+        dataset.add_column(f"{disease}_age_p",
+            (patients.age_on(getattr(dataset, f"{disease}_prim_date"))
+            )               
+        )
+
+        # Alive at incident diagnosis date - primary care only
+        dataset.add_column(f"{disease}_alive_inc_p",
+            ((dataset.date_of_death.is_after(getattr(dataset, f"{disease}_prim_date"))) | dataset.date_of_death.is_null()
+            ).when_null_then(False)
+        )
+    
+    return dataset
+
+def get_population(dataset, diseases=diseases):
+    # Create variable for anyone with at least one diagnostic code
+    any_inc_case = reduce(lambda x, y: x | y, [
+        getattr(dataset, f"{d}_inc_case") for d in diseases
+    ])
+
+    # Define population as any patient with at least one diagnostic code, registered after index date - then apply further restrictions later (age, death and preceding registration)
+    return (any_inc_case
+        & any_registration 
+        & dataset.sex.is_in(["male", "female"]))
+
+# Columns written by create_dataset_with_variables, with their types
+def incidence_columns(diseases=diseases, lookbacks=registration_lookbacks, nth_code=nth_code, confirmations=confirmation_months):
+    columns = {"sex": str, "date_of_death": date, "ethnicity": str, "imd_quintile": str}
+    for disease in diseases:
+        columns[f"{disease}_prim_date"] = date
+        for n in range(2, nth_code + 1):
+            columns[f"{disease}_prim_code{n}_date"] = date
+        columns[f"{disease}_prim_count"] = int
+        if hasattr(codelists, f"{disease}_icd"):
+            columns[f"{disease}_sec_date"] = date
+            for n in range(2, nth_code + 1):
+                columns[f"{disease}_sec_code{n}_date"] = date
+            columns[f"{disease}_sec_count"] = int
+        columns[f"{disease}_inc_date"] = date
+        for months_after in confirmations:
+            columns[f"{disease}_confirmed_{months_after}m"] = bool
+        columns[f"{disease}_inc_case"] = bool
+        for lookback in lookbacks:
+            columns[f"{disease}_pre_reg_{lookback}m"] = bool
+        columns[f"{disease}_age"] = int
+        columns[f"{disease}_alive_inc"] = bool
+        columns[f"{disease}_inc_case_p"] = bool
+        for lookback in lookbacks:
+            columns[f"{disease}_pre_reg_p_{lookback}m"] = bool
+        columns[f"{disease}_age_p"] = int
+        columns[f"{disease}_alive_inc_p"] = bool
+    return columns
+
+# Output of generate_dataset_incidence as a patient-level table (one row per patient in the incidence population), so downstream definitions can join on the disease columns instead of recomputing them - CSV or Arrow, by file extension
+def incidence_output_table(diseases=diseases, lookbacks=registration_lookbacks, path="output/dataset_incidence.arrow"):
+    frame = type("incidence_output", (PatientFrame,), {
+        name: Series(column_type) for name, column_type in incidence_columns(diseases, lookbacks).items()
+    })
+    return table_from_file(path)(frame)
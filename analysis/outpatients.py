@@ -0,0 +1,61 @@
+from ehrql import months
+from ehrql.tables.tpp import opa, clinical_events
+
+# Specialty outpatient appointments (HES OPA) and the referrals leading to them.
+# First attendances, appointments around a date and follow-up counts are all
+# narrowed from specialty_appointments(), so the specialty and date filters are
+# written in one place.
+
+
+# Appointments with a specialty (treatment function code, e.g. "410" for rheumatology) on or before end date
+def specialty_appointments(treatment_function_code, end_date):
+    return opa.where(
+        opa.treatment_function_code == treatment_function_code
+    ).where(
+        opa.appointment_date.is_on_or_before(end_date)
+    )
+
+
+# Appointments from N months before to N months after date
+def appointments_around(appointments, dx_date, months_before=12, months_after=12):
+    return appointments.where(
+        (appointments.appointment_date >= (dx_date - months(months_before))) &
+        (appointments.appointment_date <= (dx_date + months(months_after)))
+    )
+
+
+# First attendances only (first attendance face to face or by telephone/telemedicine)
+def first_attendances(appointments):
+    return appointments.where(
+        appointments.first_attendance.is_in(["1", "3"])
+    )
+
+
+# Earliest appointment
+def first_appointment(appointments):
+    return appointments.sort_by(
+        appointments.appointment_date
+    ).first_for_patient()
+
+
+# Count of appointments from date up to N months after it
+def appointment_count_within(appointments, from_date, months_after=12):
+    return appointments.where(
+        (appointments.appointment_date >= from_date) &
+        (appointments.appointment_date <= (from_date + months(months_after)))
+    ).count_for_patient()
+
+
+# Date of last referral code in each lookback before appointment date - keyed by number of months
+def last_referral_before(referral_codelist, appt_date, lookback_months):
+    referrals = clinical_events.where(
+        clinical_events.snomedct_code.is_in(referral_codelist)
+    ).where(
+        clinical_events.date <= appt_date
+    )
+    return {
+        n: referrals.where(
+            referrals.date >= (appt_date - months(n))
+        ).date.maximum_for_patient()
+        for n in lookback_months
+    }
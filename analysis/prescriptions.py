@@ -0,0 +1,70 @@
+from ehrql import days, case, when
+from ehrql.tables.tpp import medications
+
+# Prescription summaries and treatment episodes for any number of drugs (given as a
+# {drug: codelist} dict) and date windows.
+
+
+# Prescriptions of one drug on or before end date
+def prescription_events(codelist, end_date):
+    return medications.where(
+        medications.dmd_code.is_in(codelist)
+    ).where(
+        medications.date.is_on_or_before(end_date)
+    )
+
+
+# Prescriptions on or between start and stop (either may be None, for no bound)
+def prescriptions_in_window(prescriptions, start, stop):
+    if start is not None:
+        prescriptions = prescriptions.where(prescriptions.date >= start)
+    if stop is not None:
+        prescriptions = prescriptions.where(prescriptions.date <= stop)
+    return prescriptions
+
+
+# First date, last date and count of prescriptions for each drug and window - keyed by (drug, window)
+def prescription_summary(codelists_by_drug, windows, end_date):
+    summary = {}
+    for drug, codelist in codelists_by_drug.items():
+        for window, (start, stop) in windows.items():
+            in_window = prescriptions_in_window(
+                prescription_events(codelist, end_date), start, stop
+            )
+            summary[drug, window] = {
+                "first_date": in_window.date.minimum_for_patient(),
+                "last_date": in_window.date.maximum_for_patient(),
+                "count": in_window.count_for_patient(),
+            }
+    return summary
+
+
+# First continuous treatment episode of the given prescriptions. A prescription continues the episode if
+# it is within coverage_days + gap_days of the last one, and the episode stops coverage_days after its last
+# prescription. ehrQL can't compare prescriptions with each other, so the episode is followed a fixed number
+# of steps from the first prescription, each moving to the latest prescription within reach. Each step is a
+# plain aggregation filtered on the one before, so the query grows linearly with max_steps - every two steps
+# move on by more than coverage_days + gap_days. If a prescription is still within reach after the last step,
+# truncated is True and the episode has no stop date.
+def first_treatment_episode(prescriptions, coverage_days=28, gap_days=60, max_steps=6):
+    reach = days(coverage_days + gap_days)
+    start = prescriptions.date.minimum_for_patient()
+    last = start
+    for _ in range(max_steps):
+        last = prescriptions.where(prescriptions.date <= last + reach).date.maximum_for_patient()
+    truncated = prescriptions.where(
+        (prescriptions.date > last) & (prescriptions.date <= last + reach)
+    ).exists_for_patient()
+    return {
+        "start_date": start,
+        "stop_date": case(when(~truncated).then(last + days(coverage_days))),
+        "truncated": truncated,
+    }
+
+
+# First episode start and stop, and whether it was truncated, for each drug - keyed by drug
+def prescription_episodes(codelists_by_drug, end_date, **episode_options):
+    return {
+        drug: first_treatment_episode(prescription_events(codelist, end_date), **episode_options)
+        for drug, codelist in codelists_by_drug.items()
+    }
@@ -0,0 +1,44 @@
+from ehrql import months
+from ehrql.tables.tpp import practice_registrations
+
+# Shared practice registration coverage for dataset and measures definitions.
+# Coverage on a date is summarised as the start of the earliest registration still
+# open on that date, and every lookback for that date is answered from that one series.
+
+
+# Registrations open on date (started on or before it, and not ended on or before it)
+def registrations_covering(dx_date):
+    return practice_registrations.where(
+        practice_registrations.start_date.is_on_or_before(dx_date)
+    ).except_where(
+        practice_registrations.end_date.is_on_or_before(dx_date)
+    )
+
+
+# Start of the earliest registration still open on date - earlier registrations that
+# ended before date are not counted, even if they ran straight into this one
+def registered_since(dx_date):
+    return registrations_covering(dx_date).start_date.minimum_for_patient()
+
+
+# Registered for at least N months prior to date (False if date is missing)
+def registered_for(dx_date, lookback_months=12):
+    return registered_since(dx_date).is_on_or_before(
+        dx_date - months(lookback_months)
+    ).when_null_then(False)
+
+
+# As above, for several lookbacks at once - keyed by number of months
+def registered_for_each(dx_date, lookback_months):
+    return {n: registered_for(dx_date, n) for n in lookback_months}
+
+
+# Most recent registration that started at least N months prior to date and was still open on it
+def registration_for(dx_date, lookback_months=12):
+    return registrations_covering(dx_date).where(
+        practice_registrations.start_date.is_on_or_before(dx_date - months(lookback_months))
+    ).sort_by(
+        practice_registrations.start_date,
+        practice_registrations.end_date,
+        practice_registrations.practice_pseudo_id,
+    ).last_for_patient()
@@ -1,7 +1,30 @@
 import ast
 import csv
+import glob
+import hashlib
+import io
+import json
+import mmap
+import multiprocessing
+import re
+import struct
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
 
+ICD_REFERENCE_PATH = Path("icd_combined_2026-02-05.csv")
+# bump if the layout written by write_icd_reference_cache changes
+ICD_CACHE_MAGIC = b"ICDREF1" + (b"L" if sys.byteorder == "little" else b"B")
+ICD_CACHE_HEADER = struct.Struct("<8s32sIII")
+CODELISTS_JSON_PATH = Path("codelists/codelists.json")
+MANIFEST_PATH = Path("local_codelists/.manifest.json")
+
 
 # load as dict with code as key for easier later deduping
 def load_codelist(path: Path) -> dict:
@@ -11,10 +34,30 @@ def load_codelist(path: Path) -> dict:
     }
 
 
-def write_fixed_codelist(codelist: dict, path: Path):
-    def output_path(path: Path) -> Path:
-        return Path("local_codelists") / (path.stem + "_fixed" + path.suffix)
+def fixed_codelist_path(path: Path) -> Path:
+    return Path("local_codelists") / (path.stem + "_fixed" + path.suffix)
+
+
+# map a local_codelists/*_fixed.csv back to the codelists/ file it was fixed from
+def upstream_codelist_path(path: Path) -> Path:
+    if path.parent.name == "local_codelists" and path.stem.endswith("_fixed"):
+        return Path("codelists") / (path.stem.removesuffix("_fixed") + path.suffix)
+    return path
+
+
+# leaves the file (and its mtime) alone if the content is unchanged - line endings
+# are ignored since git normalises the csv module's CRLFs on checkout
+def write_if_changed(path: Path, text: str) -> bool:
+    def normalised(data: bytes) -> bytes:
+        return data.replace(b"\r\n", b"\n")
 
+    if path.exists() and normalised(path.read_bytes()) == normalised(text.encode()):
+        return False
+    path.write_bytes(text.encode())
+    return True
+
+
+def write_fixed_codelist(codelist: dict, path: Path):
     codelist_output = []
 
     for code, values in codelist.items():
@@ -24,83 +67,469 @@ def write_fixed_codelist(codelist: dict, path: Path):
         row = {"code": code} | values
         codelist_output.append(row)
 
-    fixed_path = output_path(path)
-    with fixed_path.open("w") as f:
-        writer = csv.DictWriter(f, fieldnames=["code", "term"], extrasaction="ignore")
-        writer.writeheader()
-        writer.writerows(sorted(codelist_output, key=lambda x: x["code"]))
+    fixed_path = fixed_codelist_path(path)
+    f = io.StringIO(newline="")
+    writer = csv.DictWriter(f, fieldnames=["code", "term"], extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(sorted(codelist_output, key=lambda x: x["code"]))
+    write_if_changed(fixed_path, f.getvalue())
 
     return fixed_path
 
 
-# get child codes of every code in codelist, add in if missing
-def fix_missing_children(codelist: dict, icd_combined: list) -> dict:
-    def find_children(code: str) -> dict:
-        return {
-            i["code"]: {k: v for k, v in i.items() if k != "code"}
-            for i in icd_combined
-            if i["parent_id"] == code
-        }
+# columnar copy of the ICD reference: every value is an index into one table of
+# interned strings, and each column is a flat uint32 array
+@dataclass
+class IcdReference:
+    fieldnames: list
+    strings: list
+    columns: dict
+
+    def __len__(self) -> int:
+        return len(self.columns["code"])
+
+    def value(self, column: str, i: int) -> str:
+        return self.strings[self.columns[column][i]]
+
+    def row(self, i: int) -> dict:
+        return {name: self.strings[self.columns[name][i]] for name in self.fieldnames}
+
+    def __iter__(self):
+        return (self.row(i) for i in range(len(self)))
+
+    @classmethod
+    def from_rows(cls, fieldnames: list, rows: list) -> "IcdReference":
+        string_ids = dict()
+        columns = {name: array("I") for name in fieldnames}
+        for row in rows:
+            for name in fieldnames:
+                value = row[name] or ""
+                columns[name].append(string_ids.setdefault(value, len(string_ids)))
+        return cls(list(fieldnames), [sys.intern(s) for s in string_ids], columns)
+
+
+def read_icd_reference_csv(path: Path) -> IcdReference:
+    with path.open() as f:
+        reader = csv.DictReader(f)
+        return IcdReference.from_rows(reader.fieldnames, list(reader))
+
+
+# header (magic, sha256 of the csv, row count, fieldname and string table sizes), then the
+# NUL-joined fieldnames and strings, then each column as uint32s
+def write_icd_reference_cache(reference: IcdReference, digest: bytes, path: Path):
+    names = "\0".join(reference.fieldnames).encode()
+    strings = "\0".join(reference.strings).encode()
+    header = ICD_CACHE_HEADER.pack(
+        ICD_CACHE_MAGIC, digest, len(reference), len(names), len(strings)
+    )
+    padding = b"\0" * (-(len(header) + len(names) + len(strings)) % 4)
+
+    tmp_path = path.with_suffix(".tmp")
+    with tmp_path.open("wb") as f:
+        f.write(header + names + strings + padding)
+        for name in reference.fieldnames:
+            reference.columns[name].tofile(f)
+    tmp_path.replace(path)
+
+
+# returns None if the cache is missing, from another layout or for another csv
+def read_icd_reference_cache(digest: bytes, path: Path):
+    # an empty file can't be mapped - treat it (e.g. an interrupted write) as missing
+    if not path.exists() or path.stat().st_size < ICD_CACHE_HEADER.size:
+        return None
+
+    with path.open("rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    view = memoryview(buffer)
+    magic, cached_digest, n_rows, names_size, strings_size = (
+        ICD_CACHE_HEADER.unpack_from(view)
+    )
+    if magic != ICD_CACHE_MAGIC or cached_digest != digest:
+        # unmap before returning, so the cache can be replaced (Windows won't
+        # replace a file that is still mapped)
+        view.release()
+        buffer.close()
+        return None
+
+    offset = ICD_CACHE_HEADER.size
+    fieldnames = bytes(view[offset : offset + names_size]).decode().split("\0")
+    offset += names_size
+    strings = bytes(view[offset : offset + strings_size]).decode().split("\0")
+    offset += strings_size
+    offset += -offset % 4
+
+    columns = dict()
+    for name in fieldnames:
+        columns[name] = view[offset : offset + 4 * n_rows].cast("I")
+        offset += 4 * n_rows
+
+    return IcdReference(fieldnames, [sys.intern(s) for s in strings], columns)
+
+
+# memory-map the cached reference, rebuilding it first if the csv has changed
+def load_icd_reference(path: Path = ICD_REFERENCE_PATH, digest: bytes = None):
+    if digest is None:
+        digest = hashlib.sha256(path.read_bytes()).digest()
+    cache_path = path.with_suffix(".cache")
+
+    if (reference := read_icd_reference_cache(digest, cache_path)) is not None:
+        return reference
+
+    write_icd_reference_cache(read_icd_reference_csv(path), digest, cache_path)
+    return read_icd_reference_cache(digest, cache_path)
+
+
+# parent -> children adjacency over the reference, with pre-order interval labels
+# so that the descendants of a code are a contiguous slice of `order`
+@dataclass
+class IcdHierarchy:
+    reference: IcdReference
+    index: dict = field(default_factory=dict)
+    children: dict = field(default_factory=dict)
+    order: list = field(default_factory=list)
+    enter: dict = field(default_factory=dict)
+    exit: dict = field(default_factory=dict)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.index
+
+    def value(self, code: str, column: str) -> str:
+        return self.reference.value(column, self.index[code])
+
+    def row(self, code: str) -> dict:
+        row = self.reference.row(self.index[code])
+        del row["code"]
+        return row
+
+    def direct_children(self, code: str) -> list:
+        return self.children.get(code, [])
+
+    # all codes below `code`, in pre-order
+    def descendants(self, code: str) -> list:
+        if code not in self.enter:
+            return []
+        return self.order[self.enter[code] + 1 : self.exit[code]]
+
+    # true if `code` sits anywhere below `ancestor`
+    def is_descendant(self, code: str, ancestor: str) -> bool:
+        if code not in self.enter or ancestor not in self.enter:
+            return False
+        return self.enter[ancestor] < self.enter[code] < self.exit[ancestor]
+
+
+def build_icd_hierarchy(reference: IcdReference) -> IcdHierarchy:
+    hierarchy = IcdHierarchy(reference)
+    codes = [reference.value("code", i) for i in range(len(reference))]
+    hierarchy.index = {code: i for i, code in enumerate(codes)}
+    roots = []
+    for i, code in enumerate(codes):
+        parent = reference.value("parent_id", i)
+        if parent and parent in hierarchy.index:
+            hierarchy.children.setdefault(parent, []).append(code)
+        else:
+            roots.append(code)
+
+    # iterative DFS - the tree is shallow but a deep reference shouldn't blow the stack
+    stack = [(code, False) for code in reversed(roots)]
+    while stack:
+        code, visited = stack.pop()
+        if visited:
+            hierarchy.exit[code] = len(hierarchy.order)
+            continue
+        hierarchy.enter[code] = len(hierarchy.order)
+        hierarchy.order.append(code)
+        stack.append((code, True))
+        stack.extend((c, False) for c in reversed(hierarchy.children.get(code, [])))
+
+    return hierarchy
+
 
+# get child codes of every code in codelist, add in if missing
+# (full_depth also pulls in grandchildren and below, not just direct children)
+def fix_missing_children(
+    codelist: dict, hierarchy: IcdHierarchy, full_depth: bool = False
+) -> dict:
+    codes = set(codelist.keys())
     child_codes = dict()
     for code in codelist:
-        children = find_children(code)
+        if full_depth:
+            children = hierarchy.descendants(code)
+        else:
+            children = hierarchy.direct_children(code)
         # don't add if sibling codes found - likely purposeful exclusion
-        if not any(set(codelist.keys()).intersection(children.keys())):
-            child_codes |= find_children(code)
+        if codes.isdisjoint(children):
+            child_codes |= {c: hierarchy.row(c) for c in children}
 
     # prioritise original codelist entries over anything we find
     return child_codes | codelist
 
 
-# get codes with identical term to existing term (i.e 2016 vs 2019)
-def fix_version_differences(codelist: dict, icd_combined: list) -> dict:
-    def get_alternate_codes(term: str) -> dict:
-        return {
-            i["code"]: {k: v for k, v in i.items() if k != "code"}
-            for i in icd_combined
-            if i["term"] == term
-        }
+# fold case, whitespace and punctuation so trivially different terms compare equal
+def normalise_term(term: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", term.casefold()).split())
+
+
+# normalised term -> codes carrying that term, built once per run
+def build_term_index(hierarchy: IcdHierarchy) -> dict:
+    term_index = dict()
+    for code in hierarchy.index:
+        term_index.setdefault(normalise_term(hierarchy.value(code, "term")), []).append(
+            code
+        )
+    return term_index
+
+
+# normalised terms shared by reference rows whose raw terms differ
+def find_term_collisions(term_index: dict, hierarchy: IcdHierarchy) -> dict:
+    collisions = dict()
+    for normalised, codes in term_index.items():
+        terms = {hierarchy.value(c, "term") for c in codes}
+        if len(terms) > 1:
+            collisions[normalised] = sorted(terms)
+    return collisions
 
+
+# get codes with identical term to existing term (i.e 2016 vs 2019)
+def fix_version_differences(
+    codelist: dict, term_index: dict, hierarchy: IcdHierarchy
+) -> dict:
     codes_by_term = dict()
-    for term in [v["term"] for v in codelist.values()]:
-        codes_by_term |= get_alternate_codes(term)
+    for term in {normalise_term(v["term"]) for v in codelist.values()}:
+        codes_by_term |= {c: hierarchy.row(c) for c in term_index.get(term, [])}
 
     # prioritise original codelist entries over anything we find
     return codes_by_term | codelist
 
 
+# built once per process and shared read-only by batch workers (inherited on fork)
+_indexes = None
+
+
+def get_indexes(digest: bytes = None) -> tuple:
+    global _indexes
+    if _indexes is None:
+        hierarchy = build_icd_hierarchy(load_icd_reference(ICD_REFERENCE_PATH, digest))
+        _indexes = (hierarchy, build_term_index(hierarchy))
+    return _indexes
+
+
+# fix one codelist, writing it to local_codelists if anything was added
+def fix_codelist(path: Path, full_depth: bool = False) -> dict:
+    start = time.perf_counter()
+    hierarchy, term_index = get_indexes()
+
+    codelist = load_codelist(path)
+    with_children = fix_missing_children(codelist, hierarchy, full_depth=full_depth)
+    fixed_codelist = fix_version_differences(with_children, term_index, hierarchy)
+    output_path = path
+    if fixed_codelist != codelist:
+        output_path = write_fixed_codelist(fixed_codelist, path)
+
+    return {
+        "codelist": str(path),
+        "output": str(output_path),
+        "children_added": sorted(with_children.keys() - codelist.keys()),
+        "alternates_added": sorted(fixed_codelist.keys() - with_children.keys()),
+        "seconds": round(time.perf_counter() - start, 6),
+    }
+
+
+# fix every codelist matching the given paths/globs across a process pool
+# codelists matched by the patterns - every pattern must match something, and no two
+# codelists may share a name, as they would be fixed to the same local_codelists file
+def batch_codelist_paths(patterns: list) -> list:
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        if not matches:
+            raise ValueError(f"no codelists match {pattern}")
+        paths.update(Path(p) for p in matches)
+
+    outputs = dict()
+    for path in sorted(paths):
+        output = fixed_codelist_path(path)
+        if output in outputs:
+            raise ValueError(
+                f"{outputs[output]} and {path} would both be fixed to {output}"
+            )
+        outputs[output] = path
+    return sorted(paths)
+
+
+# paths are resolved (and checked) before any codelist is fixed
+def fix_codelists_batch(patterns: list, full_depth: bool = False, jobs: int = None):
+    return fix_codelist_paths(batch_codelist_paths(patterns), full_depth, jobs)
+
+
+def fix_codelist_paths(paths: list, full_depth: bool = False, jobs: int = None):
+    fix = partial(fix_codelist, full_depth=full_depth)
+
+    # build the indexes before starting workers so forked workers share them
+    get_indexes()
+    if jobs == 1 or len(paths) <= 1:
+        yield from map(fix, paths)
+        return
+
+    start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=get_indexes,
+    ) as executor:
+        yield from executor.map(fix, paths)
+
+
+# sha of each upstream codelist as recorded by `opensafely codelists update`,
+# falling back to hashing the file for anything not listed there
+def codelist_input_sha(path: Path, upstream_shas: dict) -> str:
+    if path.parent == CODELISTS_JSON_PATH.parent and path.name in upstream_shas:
+        return upstream_shas[path.name]
+    return hashlib.sha1(path.read_bytes()).hexdigest()
+
+
+def load_manifest(path: Path = MANIFEST_PATH) -> dict:
+    if not path.exists():
+        return {"codelists": {}}
+    return json.loads(path.read_text())
+
+
+# startup time and peak python heap of loading the reference, csv vs cache
+def benchmark_icd_reference(path: Path = ICD_REFERENCE_PATH):
+    # timed and traced separately as tracemalloc slows allocation-heavy code
+    def measure(label: str, load):
+        start = time.perf_counter()
+        build_icd_hierarchy(load())
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        build_icd_hierarchy(load())
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{label}: {elapsed * 1000:.1f} ms, peak {peak / 2**20:.1f} MiB")
+
+    def load_cold() -> IcdReference:
+        path.with_suffix(".cache").unlink(missing_ok=True)
+        return load_icd_reference(path)
+
+    measure("csv", lambda: read_icd_reference_csv(path))
+    measure("cache (cold)", load_cold)
+    measure("cache (warm)", lambda: load_icd_reference(path))
+
+
 def main():
-    with Path("icd_combined_2026-02-05.csv").open() as f:
-        icd_combined = list(csv.DictReader(f))
+    parser = ArgumentParser()
+    parser.add_argument(
+        "codelists",
+        nargs="*",
+        help=(
+            "codelist csvs or globs to fix in batch, printing a json summary line "
+            "per codelist; codelists_ehrQL.py and the manifest are left alone"
+        ),
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="worker processes for batch mode (default: one per core)",
+    )
+    parser.add_argument(
+        "--full-depth",
+        action="store_true",
+        help="add all descendants of each code, not just direct children",
+    )
+    parser.add_argument(
+        "--report-collisions",
+        action="store_true",
+        help="print reference terms that only match once normalised",
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="report reference load time and peak memory, csv vs cache, and exit",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"only re-fix codelists whose inputs changed since {MANIFEST_PATH}",
+    )
+    args = parser.parse_args()
+
+    if args.benchmark:
+        benchmark_icd_reference()
+        return
+
+    if args.codelists:
+        try:
+            summaries = fix_codelists_batch(args.codelists, args.full_depth, args.jobs)
+        except ValueError as e:
+            parser.error(str(e))
+        for summary in summaries:
+            print(json.dumps(summary))
+        return
+
+    reference_digest = hashlib.sha256(ICD_REFERENCE_PATH.read_bytes()).digest()
+    upstream_shas = {
+        name: entry["sha"]
+        for name, entry in json.loads(CODELISTS_JSON_PATH.read_text())["files"].items()
+    }
+    # everything other than the codelist itself that can change the fixed output
+    fixer_key = {
+        "reference_sha": reference_digest.hex(),
+        "fixer_sha": hashlib.sha1(Path(__file__).read_bytes()).hexdigest(),
+        "full_depth": args.full_depth,
+    }
+    manifest = load_manifest()
+    if not args.incremental or {k: manifest.get(k) for k in fixer_key} != fixer_key:
+        manifest = {"codelists": {}}
+
+    if args.report_collisions:
+        hierarchy, term_index = get_indexes(reference_digest)
+        for normalised, terms in find_term_collisions(term_index, hierarchy).items():
+            print(f"{normalised}: {' | '.join(terms)}")
 
     codelists_ehrQL_path = Path("analysis/codelists_ehrQL.py")
     codelists_ehrQL = codelists_ehrQL_path.read_text()
 
+    # codelists are registered as csv_codelist("<name>", "<path>", ...)
     tree = ast.parse(codelists_ehrQL)
     icd = [
-        t
+        t.value
         for t in tree.body
-        if isinstance(t, ast.Assign)
-        and t.targets[0].id.endswith("_icd")
+        if isinstance(t, ast.Expr)
         and isinstance(t.value, ast.Call)
-        and t.value.func.id == "codelist_from_csv"
+        and isinstance(t.value.func, ast.Name)
+        and t.value.func.id == "csv_codelist"
+        and t.value.args[0].value.endswith("_icd")
     ]
 
-    icd_codelist_paths = [Path(c) for c in [i.value.args[0].value for i in icd]]
-    fixed_codelists = []
+    icd_codelist_paths = [Path(c) for c in [i.args[1].value for i in icd]]
+    codelist_paths = []
+    manifest_codelists = dict()
     for icd_codelist_path in icd_codelist_paths:
-        codelist = load_codelist(icd_codelist_path)
-        fixed_codelist = fix_missing_children(codelist, icd_combined)
-        fixed_codelist = fix_version_differences(fixed_codelist, icd_combined)
-        if fixed_codelist != codelist:
-            fixed_path = write_fixed_codelist(fixed_codelist, icd_codelist_path)
-            fixed_codelists.append((icd_codelist_path, fixed_path))
-
-    for old_path, new_path in fixed_codelists:
+        upstream_path = upstream_codelist_path(icd_codelist_path)
+        input_sha = codelist_input_sha(upstream_path, upstream_shas)
+
+        entry = manifest["codelists"].get(str(upstream_path))
+        # the reference and indexes are only loaded if something needs fixing
+        if (
+            entry is None
+            or entry["sha"] != input_sha
+            or not Path(entry["output"]).exists()
+        ):
+            get_indexes(reference_digest)
+            summary = fix_codelist(upstream_path, full_depth=args.full_depth)
+            entry = {"sha": input_sha, "output": summary["output"]}
+
+        manifest_codelists[str(upstream_path)] = entry
+        codelist_paths.append((icd_codelist_path, Path(entry["output"])))
+
+    for old_path, new_path in codelist_paths:
         codelists_ehrQL = codelists_ehrQL.replace(str(old_path), str(new_path))
 
-    Path("analysis/codelists_ehrQL.py").write_text(codelists_ehrQL)
+    write_if_changed(codelists_ehrQL_path, codelists_ehrQL)
+    write_if_changed(
+        MANIFEST_PATH,
+        json.dumps(fixer_key | {"codelists": manifest_codelists}, indent=2) + "\n",
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,529 @@
+import ast
+import csv
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+import numpy as np
+import pyarrow
+import pyarrow.compute
+import pyarrow.csv
+import pyarrow.ipc
+
+# Seeded synthetic ehrQL dummy tables, with codes sampled from the project's own
+# codelists at a configurable prevalence, for realistic local runs:
+#
+#   python generate_dummy_tables.py --patients 1000000
+#   opensafely exec ehrql:v1 generate-dataset analysis/dataset_definition_incidence.py \
+#       --dummy-tables dummy_tables --output output/dataset_incidence.arrow
+#
+# Every table is built column-wise with numpy (patients with N events are expanded
+# with np.repeat rather than looped over), so a million patients takes seconds.
+
+CODELISTS_EHRQL_PATH = Path("analysis/codelists_ehrQL.py")
+DUMMY_TABLES_PATH = Path("dummy_tables")
+
+HISTORY_START = np.datetime64("1990-01-01")
+INDEX_DATE = np.datetime64("2016-04-01")
+FUP_DATE = np.datetime64("2025-09-30")
+NAT = np.datetime64("NaT", "D")
+
+# proportion of patients with a code for each disease (any time up to follow-up)
+DISEASE_PREVALENCE = {
+    "rheumatoid": 0.008,
+    "psa": 0.003,
+    "axialspa": 0.002,
+    "undiffia": 0.002,
+    "gca": 0.001,
+    "sjogren": 0.001,
+    "ssc": 0.0003,
+    "sle": 0.001,
+    "myositis": 0.0002,
+    "anca": 0.0002,
+}
+EIA_DISEASES = ["rheumatoid", "psa", "axialspa", "undiffia"]
+
+# proportion of patients with codes from each other codelist, by table and column
+SNOMED_EVENT_RATES = {
+    "ethnicity_codes": 0.8,
+    "bmi_codes": 0.6,
+    "creatinine_codes": 0.3,
+    "chd_codes": 0.04,
+    "diabetes_codes": 0.06,
+    "ild_codes": 0.005,
+    "copd_codes": 0.03,
+    "stroke_codes": 0.02,
+    "tia_codes": 0.01,
+    "lung_cancer_codes": 0.005,
+    "haem_cancer_codes": 0.005,
+    "solid_cancer_codes": 0.03,
+    "ckd_codes": 0.05,
+    "depression_codes": 0.1,
+    "osteoporosis_codes": 0.03,
+    "fracture_codes": 0.02,
+    "dementia_codes": 0.01,
+    "referral_rheummsk": 0.02,
+    "referral_rheumatology": 0.01,
+    "rf_tests": 0.02,
+    "ccp_tests": 0.01,
+    "rf_codes": 0.003,
+    "ccp_codes": 0.002,
+    "seropositive_codes": 0.002,
+    "erosive_codes": 0.001,
+}
+CTV3_EVENT_RATES = {"clear_smoking_codes": 0.7}
+MEDICATION_RATES = {"steroid_codes": 0.05}
+CSDMARD_CODELISTS = [
+    "methotrexate_codes",
+    "methotrexate_inj_codes",
+    "sulfasalazine_codes",
+    "hydroxychloroquine_codes",
+    "leflunomide_codes",
+]
+
+# (mean, sd) of numeric values recorded with these codelists
+NUMERIC_VALUES = {
+    "bmi_codes": (27.0, 5.0),
+    "creatinine_codes": (80.0, 20.0),
+    "rf_tests": (15.0, 20.0),
+    "ccp_tests": (10.0, 30.0),
+}
+
+# SUS ethnic category codes (Z: not stated)
+SUS_ETHNICITY_CODES = list("ABCDEFGHJKLMNPRSZ")
+
+REGIONS = [
+    "North East",
+    "North West",
+    "Yorkshire and The Humber",
+    "East Midlands",
+    "West Midlands",
+    "East",
+    "London",
+    "South East",
+    "South West",
+]
+
+# columns of each TPP table (ehrQL requires every column to be present), with types
+TABLE_SCHEMAS = {
+    "patients": {
+        "date_of_birth": pyarrow.date32(),
+        "sex": pyarrow.string(),
+        "date_of_death": pyarrow.date32(),
+    },
+    "practice_registrations": {
+        "start_date": pyarrow.date32(),
+        "end_date": pyarrow.date32(),
+        "practice_pseudo_id": pyarrow.int64(),
+        "practice_stp": pyarrow.string(),
+        "practice_nuts1_region_name": pyarrow.string(),
+        "practice_systmone_go_live_date": pyarrow.date32(),
+    },
+    "clinical_events": {
+        "date": pyarrow.date32(),
+        "snomedct_code": pyarrow.string(),
+        "ctv3_code": pyarrow.string(),
+        "numeric_value": pyarrow.float64(),
+        "consultation_id": pyarrow.int64(),
+    },
+    "medications": {
+        "date": pyarrow.date32(),
+        "dmd_code": pyarrow.string(),
+        "multilex_code": pyarrow.string(),
+        "consultation_id": pyarrow.int64(),
+    },
+    "apcs": {
+        "apcs_ident": pyarrow.int64(),
+        "admission_date": pyarrow.date32(),
+        "discharge_date": pyarrow.date32(),
+        "discharge_destination": pyarrow.string(),
+        "spell_core_hrg_sus": pyarrow.string(),
+        "admission_method": pyarrow.string(),
+        "patient_classification": pyarrow.string(),
+        "days_in_critical_care": pyarrow.int64(),
+        "primary_diagnosis": pyarrow.string(),
+        "secondary_diagnosis": pyarrow.string(),
+        "all_diagnoses": pyarrow.string(),
+        "all_procedures": pyarrow.string(),
+    },
+    "opa": {
+        "opa_ident": pyarrow.int64(),
+        "appointment_date": pyarrow.date32(),
+        "attendance_status": pyarrow.string(),
+        "consultation_medium_used": pyarrow.string(),
+        "first_attendance": pyarrow.string(),
+        "hrg_code": pyarrow.string(),
+        "treatment_function_code": pyarrow.string(),
+        "referral_request_received_date": pyarrow.date32(),
+    },
+    "addresses": {
+        "address_id": pyarrow.int64(),
+        "start_date": pyarrow.date32(),
+        "end_date": pyarrow.date32(),
+        "address_type": pyarrow.int64(),
+        "rural_urban_classification": pyarrow.int64(),
+        "imd_rounded": pyarrow.int64(),
+        "msoa_code": pyarrow.string(),
+        "has_postcode": pyarrow.bool_(),
+        "care_home_is_potential_match": pyarrow.bool_(),
+        "care_home_requires_nursing": pyarrow.bool_(),
+        "care_home_does_not_require_nursing": pyarrow.bool_(),
+    },
+    "ethnicity_from_sus": {
+        "code": pyarrow.string(),
+    },
+}
+
+
+# codelists are registered as csv_codelist("<name>", "<path>", column=...), or
+# assigned as literal lists (e.g. bmi_codes = [...])
+def codelist_registry(path: Path = CODELISTS_EHRQL_PATH) -> dict:
+    registry = {}
+    for node in ast.parse(path.read_text()).body:
+        if (
+            isinstance(node, ast.Expr)
+            and isinstance(node.value, ast.Call)
+            and isinstance(node.value.func, ast.Name)
+            and node.value.func.id == "csv_codelist"
+        ):
+            call = node.value
+            kwargs = {k.arg: k.value.value for k in call.keywords}
+            registry[call.args[0].value] = (Path(call.args[1].value), kwargs["column"])
+        elif (
+            isinstance(node, ast.Assign)
+            and isinstance(node.targets[0], ast.Name)
+            and isinstance(node.value, ast.List)
+        ):
+            registry[node.targets[0].id] = [e.value for e in node.value.elts]
+    return registry
+
+
+def load_codes(registry: dict, name: str) -> np.ndarray:
+    entry = registry[name]
+    if isinstance(entry, list):
+        return np.array(entry)
+    path, column = entry
+    with path.open() as f:
+        return np.array(sorted({row[column] for row in csv.DictReader(f) if row[column]}))
+
+
+def days(values) -> np.ndarray:
+    return np.asarray(values).astype("timedelta64[D]")
+
+
+# uniform dates between start and end (arrays or scalars; start where end <= start)
+def random_dates(rng: np.random.Generator, start, end, size: int) -> np.ndarray:
+    start = np.broadcast_to(np.asarray(start, dtype="datetime64[D]"), size)
+    end = np.broadcast_to(np.asarray(end, dtype="datetime64[D]"), size)
+    span = np.maximum((end - start).astype(np.int64), 0)
+    return start + days((rng.random(size) * span).astype(np.int64))
+
+
+# expand one row per patient into `counts` rows each - returns the repeat indices
+# and each row's position within its patient's block
+def expand(counts: np.ndarray) -> tuple:
+    index = np.repeat(np.arange(len(counts)), counts)
+    starts = np.cumsum(counts) - counts
+    position = np.arange(counts.sum()) - np.repeat(starts, counts)
+    return index, position
+
+
+def arrow_column(values, column_type) -> pyarrow.Array:
+    return pyarrow.array(values, type=column_type, from_pandas=True)
+
+
+# a table with every column of the TPP schema - columns not given are all null
+def build_table(name: str, patient_id: np.ndarray, columns: dict) -> pyarrow.Table:
+    arrays = {"patient_id": arrow_column(patient_id, pyarrow.int64())}
+    for column, column_type in TABLE_SCHEMAS[name].items():
+        arrays[column] = (
+            arrow_column(columns[column], column_type)
+            if column in columns
+            else pyarrow.nulls(len(patient_id), column_type)
+        )
+    return pyarrow.table(arrays)
+
+
+# events for the given patients, from first_dates with the later events spread over spread_days
+def coded_events(rng, patient_id, first_dates, codes, mean_events, spread_days):
+    counts = 1 + rng.poisson(mean_events - 1, len(patient_id))
+    index, position = expand(counts)
+    offsets = np.where(position == 0, 0, rng.integers(0, spread_days, len(index)))
+    return patient_id[index], first_dates[index] + days(offsets), rng.choice(codes, len(index))
+
+
+def generate_patients(rng, n: int) -> dict:
+    patient_id = np.arange(1, n + 1)
+    age_days = rng.integers(0, 100 * 365, n)
+    date_of_birth = (INDEX_DATE - days(age_days)).astype("datetime64[M]").astype("datetime64[D]")
+    dies = rng.random(n) < 0.08
+    date_of_death = random_dates(rng, np.maximum(date_of_birth, INDEX_DATE - days(5 * 365)), FUP_DATE, n)
+    return {
+        "patient_id": patient_id,
+        "date_of_birth": date_of_birth,
+        "sex": rng.choice(np.array(["female", "male", "intersex", "unknown"]), n, p=[0.495, 0.495, 0.005, 0.005]),
+        "date_of_death": np.where(dies & (date_of_death > date_of_birth), date_of_death, NAT),
+    }
+
+
+# most common SUS ethnic category, for the patients with hospital records
+def generate_ethnicity_from_sus(rng, patients: dict) -> pyarrow.Table:
+    recorded = rng.random(len(patients["patient_id"])) < 0.5
+    return build_table("ethnicity_from_sus", patients["patient_id"][recorded], {
+        "code": rng.choice(np.array(SUS_ETHNICITY_CODES), recorded.sum()),
+    })
+
+
+def generate_registrations(rng, patients: dict) -> tuple:
+    n = len(patients["patient_id"])
+    start = random_dates(rng, np.maximum(patients["date_of_birth"], HISTORY_START), FUP_DATE, n)
+    ended = rng.random(n) < 0.15
+    end = np.where(ended, random_dates(rng, start, FUP_DATE, n), NAT)
+    moved = ended & (rng.random(n) < 0.7)
+    moved_start = end[moved] + days(rng.integers(0, 60, moved.sum()))
+
+    patient_id = np.concatenate([patients["patient_id"], patients["patient_id"][moved]])
+    practices = max(n // 8000, 1)
+    practice_pseudo_id = rng.integers(1, practices + 1, len(patient_id))
+    registrations = build_table("practice_registrations", patient_id, {
+        "start_date": np.concatenate([start, moved_start]),
+        "end_date": np.concatenate([end, np.full(moved.sum(), NAT)]),
+        "practice_pseudo_id": practice_pseudo_id,
+        "practice_stp": np.char.add("E540000", (practice_pseudo_id % 42 + 10).astype(str)),
+        "practice_nuts1_region_name": np.array(REGIONS)[practice_pseudo_id % len(REGIONS)],
+    })
+    addresses = build_table("addresses", patient_id, {
+        "address_id": np.arange(1, len(patient_id) + 1),
+        "start_date": np.concatenate([start, moved_start]),
+        "end_date": np.concatenate([end, np.full(moved.sum(), NAT)]),
+        "imd_rounded": rng.integers(0, 329, len(patient_id)) * 100,
+        "has_postcode": np.ones(len(patient_id), dtype=bool),
+    })
+    return registrations, addresses
+
+
+# one first-diagnosis date per case, and that disease's coded events in primary and secondary care
+def generate_disease_cases(rng, patients: dict, registry: dict, prevalence: dict) -> tuple:
+    n = len(patients["patient_id"])
+    cases = {}
+    events = []
+    admissions = []
+    for disease, rate in prevalence.items():
+        earliest = np.maximum(patients["date_of_birth"] + days(16 * 365), np.datetime64("2000-01-01"))
+        is_case = (rng.random(n) < rate) & (earliest < FUP_DATE)
+        patient_id = patients["patient_id"][is_case]
+        first_dates = random_dates(rng, earliest[is_case], FUP_DATE, len(patient_id))
+        cases[disease] = (patient_id, first_dates)
+
+        events.append(coded_events(rng, patient_id, first_dates, load_codes(registry, f"{disease}_snomed"), 3, 3 * 365))
+
+        if f"{disease}_icd" in registry:
+            admitted = rng.random(len(patient_id)) < 0.3
+            admissions.append(coded_events(
+                rng,
+                patient_id[admitted],
+                first_dates[admitted] - days(90),
+                load_codes(registry, f"{disease}_icd"),
+                1.5,
+                2 * 365,
+            ))
+    return cases, events, admissions
+
+
+def generate_clinical_events(rng, patients: dict, registry: dict, disease_events: list) -> pyarrow.Table:
+    n = len(patients["patient_id"])
+    earliest = np.maximum(patients["date_of_birth"], HISTORY_START)
+    parts = []
+    for patient_id, dates, codes in disease_events:
+        parts.append(build_table("clinical_events", patient_id, {"date": dates, "snomedct_code": codes}))
+
+    for column, rates in [("snomedct_code", SNOMED_EVENT_RATES), ("ctv3_code", CTV3_EVENT_RATES)]:
+        for name, rate in rates.items():
+            has_code = rng.random(n) < rate
+            first_dates = random_dates(rng, earliest[has_code], FUP_DATE, has_code.sum())
+            patient_id, dates, codes = coded_events(
+                rng, patients["patient_id"][has_code], first_dates, load_codes(registry, name), 2, 5 * 365
+            )
+            columns = {"date": dates, column: codes}
+            if name in NUMERIC_VALUES:
+                mean, sd = NUMERIC_VALUES[name]
+                columns["numeric_value"] = np.round(np.abs(rng.normal(mean, sd, len(patient_id))), 1)
+            parts.append(build_table("clinical_events", patient_id, columns))
+    return pyarrow.concat_tables(parts)
+
+
+# csDMARD courses for EIA cases (28- or 56-day scripts, about a year for half of them
+# and up to follow-up for the rest, sometimes with a break in treatment), steroids
+# around diagnosis, and background steroid prescribing
+def generate_medications(rng, patients: dict, registry: dict, cases: dict) -> pyarrow.Table:
+    parts = []
+    eia_id = np.concatenate([cases[d][0] for d in EIA_DISEASES if d in cases])
+    eia_date = np.concatenate([cases[d][1] for d in EIA_DISEASES if d in cases])
+
+    treated = rng.random(len(eia_id)) < 0.6
+    drug = rng.integers(0, len(CSDMARD_CODELISTS), treated.sum())
+    counts = np.where(
+        rng.random(treated.sum()) < 0.5,
+        1 + rng.poisson(12, treated.sum()),
+        rng.integers(40, 160, treated.sum()),
+    )
+    interval = rng.choice(np.array([28, 56]), treated.sum(), p=[0.7, 0.3])
+    breaks = np.where(rng.random(treated.sum()) < 0.5, rng.integers(1, counts + 1), counts + 1)
+    index, position = expand(counts)
+    start = eia_date[treated] + days(rng.integers(0, 180, treated.sum()))
+    offsets = position * interval[index] + rng.integers(-3, 4, len(index)) + np.where(position >= breaks[index], 120, 0)
+    dates = start[index] + days(offsets)
+    dmd_code = np.empty(len(index), dtype=object)
+    for i, name in enumerate(CSDMARD_CODELISTS):
+        rows = drug[index] == i
+        dmd_code[rows] = rng.choice(load_codes(registry, name), rows.sum())
+    before_fup = dates <= FUP_DATE
+    parts.append(build_table("medications", eia_id[treated][index][before_fup], {
+        "date": dates[before_fup],
+        "dmd_code": dmd_code[before_fup].astype(str),
+    }))
+
+    steroid_codes = load_codes(registry, "steroid_codes")
+    on_steroids = rng.random(len(eia_id)) < 0.4
+    patient_id, dates, codes = coded_events(
+        rng, eia_id[on_steroids], eia_date[on_steroids] - days(60), steroid_codes, 3, 425
+    )
+    parts.append(build_table("medications", patient_id, {"date": dates, "dmd_code": codes}))
+
+    n = len(patients["patient_id"])
+    earliest = np.maximum(patients["date_of_birth"], HISTORY_START)
+    for name, rate in MEDICATION_RATES.items():
+        prescribed = rng.random(n) < rate
+        first_dates = random_dates(rng, earliest[prescribed], FUP_DATE, prescribed.sum())
+        patient_id, dates, codes = coded_events(
+            rng, patients["patient_id"][prescribed], first_dates, load_codes(registry, name), 2, 2 * 365
+        )
+        parts.append(build_table("medications", patient_id, {"date": dates, "dmd_code": codes}))
+    return pyarrow.concat_tables(parts)
+
+
+def generate_apcs(rng, disease_admissions: list) -> pyarrow.Table:
+    patient_id = np.concatenate([a[0] for a in disease_admissions])
+    admission_date = np.concatenate([a[1] for a in disease_admissions])
+    return build_table("apcs", patient_id, {
+        "apcs_ident": np.arange(1, len(patient_id) + 1),
+        "admission_date": admission_date,
+        "discharge_date": admission_date + days(rng.integers(0, 15, len(patient_id))),
+        "primary_diagnosis": np.concatenate([a[2] for a in disease_admissions]),
+    })
+
+
+# a first rheumatology appointment (with referral) around diagnosis for most cases,
+# follow-up appointments in the following year, and background appointments
+def generate_opa(rng, patients: dict, cases: dict) -> pyarrow.Table:
+    case_id = np.concatenate([patient_id for patient_id, _ in cases.values()])
+    case_date = np.concatenate([dates for _, dates in cases.values()])
+    seen = rng.random(len(case_id)) < 0.7
+    first_appt = case_date[seen] + days(rng.integers(-180, 180, seen.sum()))
+
+    counts = 1 + rng.poisson(2, seen.sum())
+    index, position = expand(counts)
+    appointment_date = first_appt[index] + days(np.where(position == 0, 0, rng.integers(14, 365, len(index))))
+    first_attendance = np.where(position == 0, "1", "2")
+    referral_date = np.where(position == 0, first_appt[index] - days(rng.integers(14, 120, len(index))), NAT)
+    rheum = build_table("opa", case_id[seen][index], {
+        "appointment_date": appointment_date,
+        "attendance_status": np.full(len(index), "5"),
+        "consultation_medium_used": rng.choice(np.array(["01", "02", "03"]), len(index), p=[0.7, 0.25, 0.05]),
+        "first_attendance": first_attendance,
+        "treatment_function_code": np.full(len(index), "410"),
+        "referral_request_received_date": referral_date,
+    })
+
+    n = len(patients["patient_id"])
+    attends = rng.random(n) < 0.1
+    first_dates = random_dates(rng, INDEX_DATE - days(3 * 365), FUP_DATE, attends.sum())
+    patient_id, dates, specialty = coded_events(
+        rng, patients["patient_id"][attends], first_dates, np.array(["100", "110", "300", "320", "502"]), 2, 2 * 365
+    )
+    other = build_table("opa", patient_id, {
+        "appointment_date": dates,
+        "attendance_status": np.full(len(patient_id), "5"),
+        "first_attendance": rng.choice(np.array(["1", "2"]), len(patient_id)),
+        "treatment_function_code": specialty,
+    })
+
+    table = pyarrow.concat_tables([rheum, other])
+    return table.set_column(
+        table.column_names.index("opa_ident"),
+        "opa_ident",
+        arrow_column(np.arange(1, table.num_rows + 1), pyarrow.int64()),
+    )
+
+
+def generate_dummy_tables(n: int, seed: int, prevalence: dict) -> dict:
+    rng = np.random.default_rng(seed)
+    registry = codelist_registry()
+
+    patients = generate_patients(rng, n)
+    registrations, addresses = generate_registrations(rng, patients)
+    cases, disease_events, disease_admissions = generate_disease_cases(rng, patients, registry, prevalence)
+    return {
+        "patients": build_table("patients", patients["patient_id"], patients),
+        "ethnicity_from_sus": generate_ethnicity_from_sus(rng, patients),
+        "practice_registrations": registrations,
+        "addresses": addresses,
+        "clinical_events": generate_clinical_events(rng, patients, registry, disease_events),
+        "medications": generate_medications(rng, patients, registry, cases),
+        "apcs": generate_apcs(rng, disease_admissions),
+        "opa": generate_opa(rng, patients, cases),
+    }
+
+
+# ehrQL reads booleans in csv files as T/F
+def write_table(table: pyarrow.Table, path: Path):
+    if path.suffix == ".arrow":
+        with pyarrow.ipc.new_file(str(path), table.schema) as writer:
+            writer.write_table(table)
+        return
+    for i, field in enumerate(table.schema):
+        if pyarrow.types.is_boolean(field.type):
+            table = table.set_column(i, field.name, pyarrow.compute.if_else(table[i], "T", "F"))
+    pyarrow.csv.write_csv(table, str(path))
+
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument("--patients", type=int, default=100_000, help="number of patients")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument(
+        "--prevalence",
+        nargs="+",
+        default=[],
+        metavar="DISEASE=PROPORTION",
+        help="override the default proportion of patients with each disease",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=DUMMY_TABLES_PATH,
+        help="directory to write one file per table to (pass to ehrQL as --dummy-tables)",
+    )
+    parser.add_argument(
+        "--format", choices=["arrow", "csv"], default="arrow", help="table file format"
+    )
+    args = parser.parse_args()
+
+    prevalence = dict(DISEASE_PREVALENCE)
+    for override in args.prevalence:
+        disease, proportion = override.split("=")
+        if disease not in prevalence:
+            parser.error(f"unknown disease: {disease}")
+        prevalence[disease] = float(proportion)
+
+    start = time.perf_counter()
+    tables = generate_dummy_tables(args.patients, args.seed, prevalence)
+    args.output.mkdir(parents=True, exist_ok=True)
+    for name, table in tables.items():
+        write_table(table, args.output / f"{name}.{args.format}")
+        print(f"{name}: {table.num_rows} rows")
+    print(f"{args.patients} patients in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()